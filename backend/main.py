@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
@@ -103,11 +104,11 @@ app.include_router(upload_pdf.router, prefix="/api", tags=["Upload"])
 app.include_router(trainings.router, prefix="/api", tags=["Treinos"])
 app.include_router(assessments.router, prefix="/api", tags=["Avaliações"])
 app.include_router(progress.router, prefix="/api", tags=["Progresso"])
-app.include_router(messages.router, prefix="/api", tags=["Mensagens"])
+app.include_router(messages.router, prefix="/api/messages", tags=["Mensagens"])  # prefixo próprio: em /api, "/" e "/{id}" de trainings respondiam antes
 app.include_router(profiles.router, prefix="/api", tags=["Perfis"])  # <- corrigido para coerência com outras rotas
 app.include_router(gemini.router, prefix="/api", tags=["IA Gemini"])
 app.include_router(admin.router, prefix="/api", tags=["Admin"])
-app.include_router(content.router, prefix="/api", tags=["Conteúdo"])
+app.include_router(content.router, prefix="/api/content", tags=["Conteúdo"])
 app.include_router(dashboard.router, prefix="/api", tags=["Dashboard"])
 app.include_router(payments.router, prefix="/api", tags=["Pagamentos"])
 app.include_router(users.router, prefix="/api", tags=["Usuários"])
@@ -133,3 +134,60 @@ async def startup_event():
         logger.info("✅ Tabelas criadas com sucesso.")
     except Exception as e:
         logger.error(f"❌ Erro ao criar tabelas: {e}", exc_info=True)
+
+    # Snapshots diários das métricas do admin (desative com DAILY_METRICS_SCHEDULER=0
+    # quando o job rodar por cron: python -m src.core.daily_metrics)
+    if os.getenv("DAILY_METRICS_SCHEDULER", "1") != "0":
+        from src.core.daily_metrics import daily_snapshot_loop
+        app.state.daily_metrics_task = asyncio.create_task(daily_snapshot_loop())
+
+    # Gravação em lote das visualizações de conteúdo (src/core/content_views.py)
+    from src.core.content_views import flush_loop
+    app.state.content_views_task = asyncio.create_task(flush_loop())
+
+    # Índice de conteúdos relacionados, montado em segundo plano (src/core/content_related.py)
+    from src.core import content_related
+    content_related.start_background_rebuild()
+
+    # Canais do WebSocket de mensagens entre workers (src/core/pubsub.py)
+    try:
+        await messages.manager.start()
+    except Exception as e:
+        logger.error(f"❌ Erro ao conectar ao pub/sub do WebSocket: {e}", exc_info=True)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Agendador dos snapshots diários (src/core/daily_metrics.py)
+    daily_metrics_task = getattr(app.state, "daily_metrics_task", None)
+    if daily_metrics_task:
+        daily_metrics_task.cancel()
+
+    # Grava as mensagens do WebSocket que ainda estão na fila (src/core/message_ingest.py)
+    from src.core.message_ingest import ingest
+    try:
+        await ingest.stop()
+    except Exception as e:
+        logger.error(f"Erro ao gravar mensagens pendentes: {e}", exc_info=True)
+
+    try:
+        await messages.manager.stop()
+    except Exception as e:
+        logger.error(f"Erro ao encerrar o pub/sub do WebSocket: {e}")
+
+    # Encerra o pool de processos das variantes de imagem (src/core/images.py)
+    from src.core import images
+    images.shutdown()
+
+    # Para o loop de gravação das visualizações e grava o que ainda está só em memória
+    from src.core import content_views
+    content_views_task = getattr(app.state, "content_views_task", None)
+    if content_views_task:
+        content_views_task.cancel()
+        try:
+            await content_views_task
+        except asyncio.CancelledError:
+            pass
+    try:
+        content_views.flush()
+    except Exception as e:
+        logger.error(f"Erro ao gravar visualizações de conteúdo: {e}", exc_info=True)
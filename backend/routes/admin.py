@@ -1,18 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from sqlalchemy.orm import Session
-from src.core.database import get_db
+from sqlalchemy import func
+from src.core.database import get_db, run_queries_concurrently
+from src.core import analytics, daily_metrics, export, pagination, pivot, table_counts, user_search
 from routes.auth import get_current_user
 from src.schemas.user import UsuarioResponse as UserProfile
-from src.core.models import Usuario, TreinoEnviado, Progresso, Avaliacao, Mensagem, Assinatura
+from src.core.models import Usuario, TreinoEnviado, Progresso, Avaliacao, Mensagem, Assinatura, Payment
 
 router = APIRouter()
 
 @router.get("/stats/overview")
-async def get_admin_overview(current_user: UserProfile = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_admin_overview(
+    exact: bool = False,
+    current_user: UserProfile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    Retorna estatísticas gerais para o painel administrativo
+    Retorna estatísticas gerais para o painel administrativo.
+
+    Os totais de tabelas grandes vêm da estimativa do PostgreSQL (pg_class.reltuples);
+    use `exact=true` para forçar COUNT(*). `count_types` informa o tipo de cada total.
+    `last_30_days` é somado dos snapshots diários (daily_metrics) mais o dia corrente;
+    assinaturas ativas e receita são contadas agora nas tabelas vivas.
     """
     # Verificar se o usuário é admin
     if current_user.role != 'admin':
@@ -22,42 +34,57 @@ async def get_admin_overview(current_user: UserProfile = Depends(get_current_use
         )
     
     try:
-        # Total de usuários
-        total_users = db.query(Usuario).count()
-        
-        # Usuários ativos (logaram nos últimos 30 dias)
+        # Usuários ativos (acessaram nos últimos 30 dias; updated_at é renovado a cada requisição autenticada)
         thirty_days_ago = datetime.now() - timedelta(days=30)
-        active_users = db.query(Usuario).filter(Usuario.ultimo_login >= thirty_days_ago).count()
-        
-        # Total de treinos enviados
-        total_trainings = db.query(TreinoEnviado).count()
-        
-        # Total de registros de progresso
-        total_progress = db.query(Progresso).count()
-        
-        # Total de avaliações
-        total_assessments = db.query(Avaliacao).count()
-        
-        # Total de mensagens
-        total_messages = db.query(Mensagem).count()
+        tomorrow = date.today() + timedelta(days=1)
+        window_start = tomorrow - timedelta(days=30)
+        
+        # Contagens independentes executadas em paralelo, cada uma em sua própria conexão
+        stats = await run_queries_concurrently({
+            "total_users": lambda db: table_counts.count_rows(db, Usuario, exact),
+            "active_users": lambda db: db.query(func.count(Usuario.id)).filter(Usuario.updated_at >= thirty_days_ago).scalar(),
+            "total_trainings": lambda db: table_counts.count_rows(db, TreinoEnviado, exact),
+            "total_progress": lambda db: table_counts.count_rows(db, Progresso, exact),
+            "total_assessments": lambda db: table_counts.count_rows(db, Avaliacao, exact),
+            "total_messages": lambda db: table_counts.count_rows(db, Mensagem, exact),
+            # Assinaturas ativas e receita (soma dos valores pagos por elas), por plano
+            "subscriptions": daily_metrics.current_stock,
+            # Últimos 30 dias a partir dos snapshots diários (+ hoje, das tabelas vivas)
+            **{
+                f"last_30_days_{metric}": (
+                    lambda db, metric=metric: sum(daily_metrics.daily_series(db, metric, window_start, tomorrow).values())
+                )
+                for metric in daily_metrics.ADDITIVE_METRICS
+            }
+        })
         
-        # Assinaturas ativas
-        active_subscriptions = db.query(Assinatura).filter(Assinatura.status == 'ativa').count()
+        # Totais de tabela inteira vêm como (valor, tipo); os filtrados são sempre exatos
+        count_types = {}
+        for key in ("total_users", "total_trainings", "total_progress", "total_assessments", "total_messages"):
+            stats[key], count_types[key] = stats[key]
         
-        # Receita total (soma dos valores pagos das assinaturas ativas)
-        revenue_data = db.query(Assinatura.valor_pago).filter(Assinatura.status == 'ativa').all()
-        total_revenue = sum(float(sub[0] or 0) for sub in revenue_data)
+        total_users = stats["total_users"]
+        active_users = stats["active_users"]
+        subscriptions = stats["subscriptions"].values()
         
         return {
             "total_users": total_users,
             "active_users": active_users,
-            "total_trainings": total_trainings,
-            "total_progress": total_progress,
-            "total_assessments": total_assessments,
-            "total_messages": total_messages,
-            "active_subscriptions": active_subscriptions,
-            "total_revenue": total_revenue,
-            "user_growth_rate": round((active_users / total_users * 100) if total_users > 0 else 0, 1)
+            "total_trainings": stats["total_trainings"],
+            "total_progress": stats["total_progress"],
+            "total_assessments": stats["total_assessments"],
+            "total_messages": stats["total_messages"],
+            "active_subscriptions": int(sum(total for total, _ in subscriptions)),
+            "total_revenue": float(sum(revenue for _, revenue in subscriptions)),
+            # Limitado a 100%: com total estimado, ativos (exato) pode superar o total
+            "user_growth_rate": round(min(active_users / total_users * 100, 100.0) if total_users > 0 else 0, 1),
+            "count_types": count_types,
+            "last_30_days": {
+                "signups": int(stats["last_30_days_signups"]),
+                "messages": int(stats["last_30_days_messages"]),
+                "progress_entries": int(stats["last_30_days_progress_entries"]),
+                "revenue": stats["last_30_days_revenue"]
+            }
         }
         
     except Exception as e:
@@ -98,7 +125,7 @@ async def get_all_users(
         total_count = query.count()
 
         # Aplicar paginação e ordenação
-        users = query.order_by(Usuario.criado_em.desc()).offset(offset).limit(limit).all()
+        users = query.order_by(Usuario.created_at.desc()).offset(offset).limit(limit).all()
         
         return {
             "users": users,
@@ -116,14 +143,87 @@ async def get_all_users(
             detail=f"Erro ao buscar usuários: {str(e)}"
         )
 
+@router.get("/users/search")
+async def search_users(
+    q: str,
+    limit: int = 20,
+    current_user: UserProfile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Busca aproximada de usuários por nome, email ou cidade, ordenada por similaridade.
+    Tolera erros de digitação (pg_trgm no PostgreSQL, índice em memória nos demais bancos).
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acesso negado. Apenas administradores podem acessar este endpoint."
+        )
+    
+    if len(q.strip()) < 2:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="O termo de busca deve ter pelo menos 2 caracteres"
+        )
+    
+    try:
+        results, backend = user_search.search_users(db, q, max(1, min(limit, 100)))
+        
+        return {
+            "results": [
+                {**UserProfile.model_validate(user).model_dump(), "score": round(score, 3)}
+                for user, score in results
+            ],
+            "backend": backend
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar usuários: {str(e)}"
+        )
+
+# Seções dos detalhes do usuário: (modelo, coluna de data usada na ordenação)
+DETAIL_SECTIONS = {
+    "trainings": (TreinoEnviado, TreinoEnviado.enviado_em),
+    "progress": (Progresso, Progresso.data_medicao),
+    "assessments": (Avaliacao, Avaliacao.data),
+    "messages": (Mensagem, Mensagem.enviado_em),
+    "subscriptions": (Assinatura, Assinatura.data_inicio),
+}
+
+DETAILS_MAX_LIMIT = 100
+
+def _row_to_dict(row) -> dict:
+    return {column.name: getattr(row, column.key) for column in row.__table__.columns}
+
+def _section_page(db: Session, section: str, user_id: str, limit: int, cursor: Optional[str] = None) -> dict:
+    """
+    Página de uma seção, da mais recente para a mais antiga (keyset por data e id).
+    Registros sem data ficam no fim.
+    """
+    model, date_column = DETAIL_SECTIONS[section]
+    query = db.query(model).filter(model.usuario_id == user_id)
+    
+    # Intervalos do índice (usuario_id, data, id) de cada tabela
+    rows, next_cursor = pagination.keyset_page(query, date_column, model.id, cursor, limit)
+    
+    return {
+        "items": [_row_to_dict(row) for row in rows],
+        "next_cursor": next_cursor
+    }
+
 @router.get("/users/{user_id}/details")
 async def get_user_details(
     user_id: str,
+    limit: int = 5,
     current_user: UserProfile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Retorna detalhes completos de um usuário específico
+    Retorna os detalhes de um usuário específico: totais de cada seção e os `limit`
+    registros mais recentes de cada uma. O restante é carregado sob demanda em
+    /users/{user_id}/details/{section} a partir de `next_cursor`.
     """
     if current_user.role != 'admin':
         raise HTTPException(
@@ -131,40 +231,41 @@ async def get_user_details(
             detail="Acesso negado. Apenas administradores podem acessar este endpoint."
         )
     
+    limit = max(1, min(limit, DETAILS_MAX_LIMIT))
+    
     try:
         # Buscar dados do usuário
         user = db.query(Usuario).filter(Usuario.id == user_id).first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Usuário não encontrado"
+            )
         
-        # Buscar treinos do usuário
-        trainings = db.query(TreinoEnviado).filter(TreinoEnviado.usuario_id == user_id).all()
-        
-        # Buscar progresso do usuário
-        progress = db.query(Progresso).filter(Progresso.usuario_id == user_id).order_by(Progresso.data_medicao.desc()).all()
-        
-        # Buscar avaliações do usuário
-        assessments = db.query(Avaliacao).filter(Avaliacao.usuario_id == user_id).all()
-        
-        # Buscar mensagens do usuário
-        messages = db.query(Mensagem).filter(Mensagem.usuario_id == user_id).order_by(Mensagem.enviado_em.desc()).all()
-        
-        # Buscar assinaturas do usuário
-        subscriptions = db.query(Assinatura).filter(Assinatura.usuario_id == user_id).order_by(Assinatura.data_inicio.desc()).all()
-        
-        return {
-            "user": user,
-            "trainings": trainings,
-            "progress": progress,
-            "assessments": assessments,
-            "messages": messages,
-            "subscriptions": subscriptions,
-            "summary": {
-                "total_trainings": len(trainings),
-                "total_progress": len(progress),
-                "total_assessments": len(assessments),
-                "total_messages": len(messages),
-                "active_subscription": any(sub.status == 'ativa' for sub in subscriptions)
-            }
+        # Totais e primeiras páginas de cada seção, em paralelo
+        queries = {
+            "active_subscription": lambda db: db.query(
+                db.query(Assinatura).filter(Assinatura.usuario_id == user_id, Assinatura.status == 'ativa').exists()
+            ).scalar()
         }
+        for section, (model, _) in DETAIL_SECTIONS.items():
+            queries[f"total_{section}"] = lambda db, model=model: db.query(func.count(model.id)).filter(model.usuario_id == user_id).scalar()
+            queries[section] = lambda db, section=section: _section_page(db, section, user_id, limit)
+        
+        results = await run_queries_concurrently(queries)
+        
+        response = {"user": UserProfile.model_validate(user).model_dump()}
+        for section in DETAIL_SECTIONS:
+            response[section] = results[section]
+        response["summary"] = {
+            "total_trainings": results["total_trainings"],
+            "total_progress": results["total_progress"],
+            "total_assessments": results["total_assessments"],
+            "total_messages": results["total_messages"],
+            "total_subscriptions": results["total_subscriptions"],
+            "active_subscription": bool(results["active_subscription"])
+        }
+        return response
         
     except HTTPException:
         raise
@@ -174,6 +275,41 @@ async def get_user_details(
             detail=f"Erro ao buscar detalhes do usuário: {str(e)}"
         )
 
+@router.get("/users/{user_id}/details/{section}")
+async def get_user_details_section(
+    user_id: str,
+    section: str,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    current_user: UserProfile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Retorna a próxima página de uma seção dos detalhes do usuário
+    (trainings, progress, assessments, messages ou subscriptions)
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acesso negado. Apenas administradores podem acessar este endpoint."
+        )
+    
+    if section not in DETAIL_SECTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Seção inválida. Use: {', '.join(DETAIL_SECTIONS)}"
+        )
+    
+    try:
+        return _section_page(db, section, user_id, max(1, min(limit, DETAILS_MAX_LIMIT)), cursor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar detalhes do usuário: {str(e)}"
+        )
+
 @router.get("/recent-activity")
 async def get_recent_activity(
     limit: int = 50,
@@ -251,9 +387,20 @@ async def get_recent_activity(
         )
 
 @router.get("/analytics/users")
-async def get_user_analytics(current_user: UserProfile = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_analytics(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = "month",
+    current_user: UserProfile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    Retorna análises de usuários para gráficos
+    Retorna análises de usuários para gráficos.
+
+    O crescimento de usuários é agrupado por dia, semana ou mês entre `start` e
+    `end` (inclusive; padrão: últimos 12 meses) a partir dos snapshots diários
+    (daily_metrics); só os dias ainda sem snapshot são contados nas tabelas.
+    A distribuição por planos são as assinaturas ativas agora.
     """
     if current_user.role != 'admin':
         raise HTTPException(
@@ -261,37 +408,62 @@ async def get_user_analytics(current_user: UserProfile = Depends(get_current_use
             detail="Acesso negado. Apenas administradores podem acessar este endpoint."
         )
     
+    if granularity not in analytics.GRANULARITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Granularidade inválida. Use: {', '.join(analytics.GRANULARITIES)}"
+        )
+    
+    now = datetime.now()
+    end_dt = datetime.combine(end, datetime.min.time()) + timedelta(days=1) if end else now
+    if start:
+        start_dt = datetime.combine(start, datetime.min.time())
+    else:
+        # Últimos 12 meses, incluindo o mês corrente
+        start_dt = analytics.truncate(now, "month")
+        for _ in range(11):
+            start_dt = analytics.truncate(start_dt - timedelta(days=1), "month")
+    
+    if start_dt >= end_dt:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A data inicial deve ser anterior à data final"
+        )
+    
     try:
-        # Usuários por mês (últimos 12 meses)
-        monthly_users = []
-        for i in range(12):
-            start_date = (datetime.now() - timedelta(days=30 * (i + 1))).replace(day=1)
-            end_date = (datetime.now() - timedelta(days=30 * i)).replace(day=1)
-            
-            count = db.query(Profile).filter(
-                Profile.criado_em >= start_date,
-                Profile.criado_em < end_date
-            ).count()
-            
-            monthly_users.append({
-                "month": start_date.strftime("%Y-%m"),
-                "count": count
-            })
-        
-        monthly_users.reverse()
-        
-        # Distribuição por planos
-        plan_distribution_query = db.query(Assinatura.plano_id, func.count(Assinatura.plano_id)).filter(Assinatura.status == 'ativa').group_by(Assinatura.plano_id).all()
-        
-        plan_distribution = {plan_id: count for plan_id, count in plan_distribution_query}
+        # Dias encerrados vêm de daily_metrics; só os dias sem snapshot (hoje) tocam a tabela usuarios
+        user_growth = daily_metrics.series_by_period(db, "signups", start_dt, end_dt, granularity)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    try:
+        # Distribuição por planos (assinaturas ativas agora)
+        plan_distribution = {
+            plan_id: int(count)
+            for plan_id, (count, _) in daily_metrics.current_stock(db).items()
+        }
         
-        return {
-            "monthly_users": monthly_users,
+        result = {
+            "granularity": granularity,
+            "user_growth": [
+                {"period": analytics.period_label(period, granularity), "count": int(count)}
+                for period, count in user_growth
+            ],
             "plan_distribution": [
                 {"label": "Série Única", "value": plan_distribution.get('serie_unica', 0)},
                 {"label": "Consultoria Completa", "value": plan_distribution.get('consultoria_completa', 0)}
             ]
         }
+        if granularity == "month":
+            # Formato anterior, mantido para compatibilidade
+            result["monthly_users"] = [
+                {"month": item["period"], "count": item["count"]} for item in result["user_growth"]
+            ]
+        
+        return result
         
     except Exception as e:
         raise HTTPException(
@@ -299,6 +471,134 @@ async def get_user_analytics(current_user: UserProfile = Depends(get_current_use
             detail=f"Erro ao buscar análises de usuários: {str(e)}"
         )
 
+@router.get("/analytics/pivot")
+async def get_pivot_analytics(
+    dimensions: str,
+    metrics: str = "users",
+    rollup: bool = False,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: UserProfile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Agregação genérica para gráficos: agrupa usuários (e suas assinaturas) pelas
+    dimensões pedidas e calcula as métricas em um único GROUP BY.
+
+    - dimensions: lista separada por vírgula (cidade, role, plano_id, signup_month, subscription_status)
+    - metrics: users, subscriptions, revenue
+    - rollup: inclui subtotais por nível e o total geral
+    - start/end: filtram pela data de cadastro (inclusive)
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acesso negado. Apenas administradores podem acessar este endpoint."
+        )
+    
+    dimension_list = [name.strip() for name in dimensions.split(",") if name.strip()]
+    metric_list = [name.strip() for name in metrics.split(",") if name.strip()]
+    start_dt = datetime.combine(start, datetime.min.time()) if start else None
+    end_dt = datetime.combine(end, datetime.min.time()) + timedelta(days=1) if end else None
+    
+    try:
+        rows, cached = pivot.aggregate(db, dimension_list, metric_list, rollup, start_dt, end_dt)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao calcular agregação: {str(e)}"
+        )
+    
+    return {
+        "dimensions": dimension_list,
+        "metrics": metric_list,
+        "rollup": rollup,
+        "rows": rows,
+        "cached": cached
+    }
+
+# Tabelas exportáveis: (modelo, coluna de data dos filtros, colunas que nunca saem)
+EXPORT_TABLES = {
+    "users": (Usuario, Usuario.created_at, {"senha_hash"}),
+    "payments": (Payment, Payment.created_at, set()),
+    "subscriptions": (Assinatura, Assinatura.data_inicio, set()),
+    "progress": (Progresso, Progresso.data_medicao, set()),
+}
+
+@router.get("/export/{table}")
+async def export_table(
+    table: str,
+    format: str = "csv",
+    columns: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    compress: bool = False,
+    current_user: UserProfile = Depends(get_current_user)
+):
+    """
+    Exporta users, payments, subscriptions ou progress em streaming (CSV ou Parquet).
+
+    `columns` seleciona colunas (separadas por vírgula), `start`/`end` filtram pela
+    data principal da tabela (inclusive) e `compress` aplica zstd (arquivo .csv.zst
+    no CSV, codec zstd das colunas no Parquet).
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acesso negado. Apenas administradores podem acessar este endpoint."
+        )
+    
+    if table not in EXPORT_TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tabela inválida. Use: {', '.join(EXPORT_TABLES)}"
+        )
+    
+    if format not in export.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato inválido. Use: {', '.join(export.FORMATS)}"
+        )
+    
+    if format == "parquet" and not export.HAS_PYARROW:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Exportação Parquet indisponível: pacote pyarrow não instalado"
+        )
+    
+    model, date_column, hidden = EXPORT_TABLES[table]
+    available = [column.name for column in model.__table__.columns if column.name not in hidden]
+    selected = [name.strip() for name in columns.split(",") if name.strip()] if columns else available
+    invalid = [name for name in selected if name not in available]
+    if invalid or not selected:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Colunas inválidas: {', '.join(invalid)}. Disponíveis: {', '.join(available)}"
+        )
+    
+    start_dt = datetime.combine(start, datetime.min.time()) if start else None
+    end_dt = datetime.combine(end, datetime.min.time()) + timedelta(days=1) if end else None
+    
+    if format == "csv":
+        body = export.stream_csv(model, selected, date_column, start_dt, end_dt, compress)
+        media_type = "application/zstd" if compress else "text/csv; charset=utf-8"
+        filename = f"{table}.csv.zst" if compress else f"{table}.csv"
+    else:
+        body = export.stream_parquet(model, selected, date_column, start_dt, end_dt, compress)
+        media_type = "application/vnd.apache.parquet"
+        filename = f"{table}.parquet"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.put("/users/{user_id}/role")
 async def update_user_role(
     user_id: str,
@@ -1,51 +1,141 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import uuid
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from src.core.database import get_db
+from src.core import content_cache, content_related, content_render, content_search, content_tags, content_views, images, pagination
+from src.core.storage import get_storage_client
 from routes.auth import get_current_user
-from src.schemas.models import Profile, Content, ContentCreate, ContentResponse, Comment, CommentCreate, CommentResponse
+from src.schemas.models import Profile, Content, ContentCreate, ContentResponse, ContentPage, ContentPopularPage, ContentRelatedPage, ContentSearchPage, TagCount, Comment, CommentCreate, CommentResponse, CommentPage
 
 router = APIRouter()
 
+LIST_DEFAULT_LIMIT = 20
+LIST_MAX_LIMIT = 100
+
+# Colunas da listagem (o corpo fica de fora; vem só em GET /content/{id})
+LIST_COLUMNS = (
+    Content.id,
+    Content.title,
+    Content.summary,
+    Content.excerpt,
+    Content.category,
+    Content.image_url,
+    Content.created_at,
+    Content.updated_at,
+)
+
+def _comment_counts(db: Session, content_ids: List[str]) -> dict:
+    """Número de comentários de vários conteúdos em uma única consulta agrupada"""
+    if not content_ids:
+        return {}
+    rows = (
+        db.query(Comment.content_id, func.count(Comment.id))
+        .filter(Comment.content_id.in_(content_ids))
+        .group_by(Comment.content_id)
+        .all()
+    )
+    return dict(rows)
+
+def _list_items(db: Session, rows) -> List[dict]:
+    """Linhas de LIST_COLUMNS + tags e contagem de comentários (uma consulta de cada para a página toda)"""
+    ids = [row.id for row in rows]
+    tags_by_id = content_tags.tags_for(db, ids)
+    counts = _comment_counts(db, ids)
+    return [
+        {
+            **row._mapping,
+            "tags": tags_by_id[row.id],
+            "comment_count": counts.get(row.id, 0),
+            "image_srcset": images.srcset_for_url(row.image_url)
+        }
+        for row in rows
+    ]
+
+def _content_dict(content: Content, tags: List[str]) -> dict:
+    data = {column.key: getattr(content, column.key) for column in Content.__table__.columns}
+    if data["body_html"] is None:
+        # Conteúdo anterior à renderização na escrita (ainda não preenchido pelo backfill)
+        data["body_html"], data["excerpt"] = content_render.render_markdown(content.body)
+    data["tags"] = tags
+    data["image_srcset"] = images.srcset_for_url(content.image_url)
+    return data
+
 # Rotas para conteúdo
 @router.post("/", response_model=ContentResponse)
 async def create_content(
     content: ContentCreate,
-    current_user: dict = Depends(get_current_user),
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Apenas administradores e personal trainers podem criar conteúdo
-    if current_user["role"] not in ["admin", "trainer"]:
+    if current_user.role not in ["admin", "trainer"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Sem permissão para criar conteúdo"
         )
     
     try:
-        db_content = Content(**content.dict(), author_id=current_user["id"], created_at=func.now())
+        values = content.dict(exclude={"tags"})
+        values["body_html"], values["excerpt"] = content_render.render_markdown(content.body)
+        db_content = Content(id=str(uuid.uuid4()), **values, author_id=current_user.id, created_at=func.now())
         db.add(db_content)
+        tags = content_tags.set_tags(db, db_content.id, content.tags)
         db.commit()
+        content_cache.invalidate(db_content.id)
         db.refresh(db_content)
+        content_related.update(db_content, tags)
         
-        return db_content
+        return _content_dict(db_content, sorted(tags))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao criar conteúdo: {str(e)}"
         )
 
-@router.get("/", response_model=List[ContentResponse])
+@router.get("/", response_model=ContentPage)
 async def get_contents(
+    request: Request,
     category: Optional[str] = None,
-    tag: Optional[str] = None,
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = content_tags.MATCH_ALL,
     published: bool = True,
-    current_user: dict = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """
+    Lista conteúdos do mais recente para o mais antigo, sem o corpo.
+    Para a próxima página, envie o `next_cursor` recebido como `cursor`.
+
+    `tag` pode ser repetido (ou separado por vírgula): com `tag_mode=all` (padrão)
+    o conteúdo precisa ter todas as tags, com `tag_mode=any` basta uma.
+
+    As páginas ficam em cache já serializadas (ver src/core/content_cache.py) e
+    respondem 304 a If-None-Match com a ETag atual.
+    """
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    
+    if tag_mode not in content_tags.MATCH_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"tag_mode inválido. Use: {', '.join(content_tags.MATCH_MODES)}"
+        )
+    tags = content_tags.normalize_tags(part for value in tag or () for part in value.split(","))
+    
+    cache_key = content_cache.list_key(
+        category=category, tags=tuple(tags), tag_mode=tag_mode, published=published, cursor=cursor, limit=limit
+    )
+    cached = content_cache.get(cache_key)
+    if cached:
+        return content_cache.respond(request, cached, public=published)
+    read_generation = content_cache.generation()
+    
     try:
-        query = db.query(Content)
+        query = db.query(*LIST_COLUMNS)
         
         if category:
             query = query.filter(Content.category == category)
@@ -53,29 +143,137 @@ async def get_contents(
         if published is not None:
             query = query.filter(Content.published == published)
         
-        # Filtro por tag (assumindo que tags é um array de strings no DB)
-        if tag:
-            # This might need adjustment based on how tags are stored in PostgreSQL
-            # For PostgreSQL array type, you might use .any() or specific array operators
-            # For simplicity, assuming a simple string match for now, or adjust schema
-            # If tags is a JSONB column, you'd use jsonb_contains
-            pass # Placeholder for tag filtering, needs database schema clarification
+        if tags:
+            query = query.filter(Content.id.in_(content_tags.matching_content_ids(tags, tag_mode)))
         
-        contents = query.order_by(Content.created_at.desc()).all()
+        # Intervalo do índice (published, created_at, id), sem ordenar as linhas do filtro
+        rows, next_cursor = pagination.keyset_page(query, Content.created_at, Content.id, cursor, limit)
         
-        return contents
+        page = ContentPage.model_validate({
+            "items": _list_items(db, rows),
+            "next_cursor": next_cursor
+        })
+        return content_cache.respond(request, content_cache.put(cache_key, page, read_generation), public=published)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao buscar conteúdos: {str(e)}"
         )
 
+@router.get("/tags", response_model=List[TagCount])
+async def get_tag_counts(
+    category: Optional[str] = None,
+    published: bool = True,
+    limit: int = 50,
+    current_user: Profile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Tags mais usadas e quantos conteúdos têm cada uma (facetas para filtros)"""
+    try:
+        rows = content_tags.tag_counts(db, published, category, max(1, min(limit, 500)))
+        return [{"tag": tag, "count": count} for tag, count in rows]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar tags: {str(e)}"
+        )
+
+@router.get("/search", response_model=ContentSearchPage)
+async def search_contents(
+    q: str,
+    limit: int = LIST_DEFAULT_LIMIT,
+    offset: int = 0,
+    current_user: Profile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Busca textual em título, resumo e corpo dos conteúdos publicados, ordenada
+    por relevância. `snippet` traz trechos em HTML escapado, com os termos marcados em <mark>.
+    Para a próxima página, envie o `next_offset` recebido como `offset`.
+    """
+    if len(q.strip()) < 2:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A busca deve ter pelo menos 2 caracteres"
+        )
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    offset = max(0, offset)
+    
+    try:
+        hits, has_more, backend = content_search.search_contents(db, q, limit, offset)
+        ids = [content_id for content_id, _, _ in hits]
+        rows = db.query(*LIST_COLUMNS).filter(Content.id.in_(ids)).all() if ids else []
+        items = {item["id"]: item for item in _list_items(db, rows)}
+        
+        return {
+            "items": [
+                {**items[content_id], "rank": rank, "snippet": snippet}
+                for content_id, rank, snippet in hits if content_id in items
+            ],
+            "next_offset": offset + limit if has_more else None,
+            "backend": backend
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar conteúdos: {str(e)}"
+        )
+
+@router.get("/popular", response_model=ContentPopularPage)
+async def get_popular_contents(
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user: Profile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Conteúdos publicados mais lidos recentemente. O ranking vem da memória
+    (src/core/content_views.py); `popularity` são as visualizações com
+    decaimento exponencial e `view_count` o total acumulado.
+    """
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    
+    try:
+        # Busca a mais para compensar rascunhos no ranking
+        ranked = content_views.popular(db, limit * 2)
+        ids = [content_id for content_id, _ in ranked]
+        rows = (
+            db.query(*LIST_COLUMNS, Content.view_count)
+            .filter(Content.id.in_(ids), Content.published.is_(True))
+            .all()
+        ) if ids else []
+        items = {item["id"]: item for item in _list_items(db, rows)}
+        
+        return {
+            "items": [
+                {**items[content_id], "view_count": items[content_id]["view_count"] or 0, "popularity": round(score, 2)}
+                for content_id, score in ranked if content_id in items
+            ][:limit]
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar conteúdos populares: {str(e)}"
+        )
+
 @router.get("/{content_id}", response_model=ContentResponse)
 async def get_content(
     content_id: str,
-    current_user: dict = Depends(get_current_user),
+    request: Request,
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """
+    Conteúdo completo. Publicados ficam em cache já serializados, com ETag (304 em If-None-Match).
+    Cada leitura conta uma visualização (em memória, gravada em lote).
+    """
+    cached = content_cache.get(content_cache.item_key(content_id))
+    if cached:
+        content_views.record_view(content_id)
+        return content_cache.respond(request, cached)
+    read_generation = content_cache.generation()
+    
     try:
         content = db.query(Content).filter(Content.id == content_id).first()
         
@@ -85,13 +283,18 @@ async def get_content(
                 detail="Conteúdo não encontrado"
             )
         
-        if not content.published and current_user["id"] != content.author_id and current_user["role"] != "admin":
+        if not content.published and current_user.id != content.author_id and current_user.role != "admin":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Sem permissão para acessar este conteúdo"
             )
         
-        return content
+        data = ContentResponse.model_validate(_content_dict(content, content_tags.tags_for(db, [content.id])[content.id]))
+        content_views.record_view(content.id)
+        if not content.published:
+            # Rascunhos dependem de permissão: nunca vão para o cache compartilhado
+            return content_cache.respond(request, content_cache.serialize(data), public=False)
+        return content_cache.respond(request, content_cache.put(content_cache.item_key(content.id), data, read_generation))
     except HTTPException:
         raise
     except Exception as e:
@@ -104,7 +307,7 @@ async def get_content(
 async def update_content(
     content_id: str,
     content_update: ContentCreate,
-    current_user: dict = Depends(get_current_user),
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     try:
@@ -116,20 +319,27 @@ async def update_content(
                 detail="Conteúdo não encontrado"
             )
         
-        if current_user["id"] != content.author_id and current_user["role"] != "admin":
+        if current_user.id != content.author_id and current_user.role != "admin":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Sem permissão para atualizar este conteúdo"
             )
         
-        for key, value in content_update.dict(exclude_unset=True).items():
+        for key, value in content_update.dict(exclude_unset=True, exclude={"tags"}).items():
             setattr(content, key, value)
+        if "body" in content_update.model_fields_set:
+            content.body_html, content.excerpt = content_render.render_markdown(content_update.body)
+        if "tags" in content_update.model_fields_set:
+            content_tags.set_tags(db, content.id, content_update.tags)
         content.updated_at = func.now()
         
         db.commit()
+        content_cache.invalidate(content.id)
         db.refresh(content)
+        tags = content_tags.tags_for(db, [content.id])[content.id]
+        content_related.update(content, tags)
         
-        return content
+        return _content_dict(content, tags)
     except HTTPException:
         raise
     except Exception as e:
@@ -141,7 +351,7 @@ async def update_content(
 @router.delete("/{content_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_content(
     content_id: str,
-    current_user: dict = Depends(get_current_user),
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     try:
@@ -153,14 +363,18 @@ async def delete_content(
                 detail="Conteúdo não encontrado"
             )
         
-        if current_user["id"] != content.author_id and current_user["role"] != "admin":
+        if current_user.id != content.author_id and current_user.role != "admin":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Sem permissão para excluir este conteúdo"
             )
         
+        content_tags.delete_tags(db, content.id)
+        content_views.delete_views(db, content.id)
         db.delete(content)
         db.commit()
+        content_cache.invalidate(content.id)
+        content_related.remove(content.id)
         
         return None
     except HTTPException:
@@ -171,12 +385,106 @@ async def delete_content(
             detail=f"Erro ao excluir conteúdo: {str(e)}"
         )
 
+@router.post("/{content_id}/image", response_model=ContentResponse)
+async def upload_content_image(
+    content_id: str,
+    file: UploadFile = File(...),
+    current_user: Profile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Envia a imagem de capa. O original é servido na hora em `image_url`; as
+    variantes WebP/JPEG são geradas em segundo plano e aparecem em `image_srcset`.
+    """
+    try:
+        content = db.query(Content).filter(Content.id == content_id).first()
+        
+        if not content:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conteúdo não encontrado"
+            )
+        
+        if current_user.id != content.author_id and current_user.role != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Sem permissão para atualizar este conteúdo"
+            )
+        
+        data = await file.read()
+        try:
+            relative_path = images.save_original("imagens", f"content/{content.id}", data, file.content_type)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        content.image_url = get_storage_client().get_public_url("imagens", relative_path)
+        content.updated_at = func.now()
+        db.commit()
+        db.refresh(content)
+        content_cache.invalidate(content.id)
+        # Respostas em cache ainda sem as variantes são descartadas quando elas ficam prontas
+        images.schedule_variants("imagens", relative_path, on_done=lambda: content_cache.invalidate(content_id))
+        
+        return _content_dict(content, content_tags.tags_for(db, [content.id])[content.id])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao enviar imagem: {str(e)}"
+        )
+
+@router.get("/{content_id}/related", response_model=ContentRelatedPage)
+async def get_related_contents(
+    content_id: str,
+    limit: int = 5,
+    current_user: Profile = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Conteúdos publicados mais parecidos (texto, tags e categoria), para "leia
+    também". Os vizinhos são pré-calculados em memória (src/core/content_related.py);
+    logo após a inicialização, enquanto o índice é montado, a lista vem vazia.
+    """
+    limit = max(1, min(limit, content_related.TOP_K))
+    
+    try:
+        content = db.query(Content.id).filter(Content.id == content_id).first()
+        
+        if not content:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conteúdo não encontrado"
+            )
+        
+        neighbors = content_related.related(db, content_id, limit)
+        ids = [neighbor_id for neighbor_id, _ in neighbors]
+        rows = db.query(*LIST_COLUMNS).filter(Content.id.in_(ids), Content.published.is_(True)).all() if ids else []
+        items = {item["id"]: item for item in _list_items(db, rows)}
+        
+        return {
+            "items": [
+                {**items[neighbor_id], "score": score}
+                for neighbor_id, score in neighbors if neighbor_id in items
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar conteúdos relacionados: {str(e)}"
+        )
+
 # Rotas para comentários
 @router.post("/{content_id}/comments", response_model=CommentResponse)
 async def create_comment(
     content_id: str,
     comment_data: CommentCreate, # Using CommentCreate Pydantic model
-    current_user: dict = Depends(get_current_user),
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     try:
@@ -188,9 +496,11 @@ async def create_comment(
                 detail="Conteúdo não encontrado"
             )
         
-        db_comment = Comment(**comment_data.dict(), content_id=content_id, user_id=current_user["id"], created_at=func.now())
+        db_comment = Comment(id=str(uuid.uuid4()), **comment_data.dict(), content_id=content_id, user_id=current_user.id, created_at=func.now())
         db.add(db_comment)
         db.commit()
+        # comment_count das listagens em cache mudou
+        content_cache.invalidate(content_id)
         db.refresh(db_comment)
         
         return db_comment
@@ -202,12 +512,20 @@ async def create_comment(
             detail=f"Erro ao criar comentário: {str(e)}"
         )
 
-@router.get("/{content_id}/comments", response_model=List[CommentResponse])
+@router.get("/{content_id}/comments", response_model=CommentPage)
 async def get_comments(
     content_id: str,
-    current_user: dict = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """
+    Comentários do mais recente para o mais antigo, paginados por cursor.
+    Para a próxima página, envie o `next_cursor` recebido como `cursor`.
+    """
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    
     try:
         content = db.query(Content).filter(Content.id == content_id).first()
         
@@ -217,9 +535,15 @@ async def get_comments(
                 detail="Conteúdo não encontrado"
             )
         
-        comments = db.query(Comment).filter(Comment.content_id == content_id).order_by(Comment.created_at.desc()).all()
+        # Intervalo do índice (content_id, created_at, id)
+        comments, next_cursor = pagination.keyset_page(
+            db.query(Comment).filter(Comment.content_id == content_id), Comment.created_at, Comment.id, cursor, limit
+        )
         
-        return comments
+        return {
+            "items": comments,
+            "next_cursor": next_cursor
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -231,7 +555,7 @@ async def get_comments(
 @router.delete("/comments/{comment_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_comment(
     comment_id: str,
-    current_user: dict = Depends(get_current_user),
+    current_user: Profile = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     try:
@@ -243,7 +567,7 @@ async def delete_comment(
                 detail="Comentário não encontrado"
             )
         
-        if current_user["id"] != comment.user_id and current_user["role"] != "admin":
+        if current_user.id != comment.user_id and current_user.role != "admin":
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Sem permissão para excluir este comentário"
@@ -251,6 +575,7 @@ async def delete_comment(
         
         db.delete(comment)
         db.commit()
+        content_cache.invalidate(comment.content_id)
         
         return None
     except HTTPException:
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from typing import Dict, Any, Optional, List
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, timedelta
 import logging
 
-from src.core.database import get_db
+from src.core.database import get_db, run_queries_concurrently
+from src.core.data_version import dashboard_etag, etag_matches, set_etag_headers, not_modified_response
 from routes.auth import get_current_user
+from routes.progress import calcular_resumo_progresso
 from src.schemas.models import Usuario, TreinoEnviado, Progresso, Mensagem, Assinatura, Avaliacao
 from pydantic import BaseModel, Field
 
@@ -111,11 +113,22 @@ async def get_dashboard_stats(current_user: Usuario = Depends(get_current_user),
         )
 
 @router.get("/user-summary", response_model=UserSummary)
-async def get_user_summary(current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_summary(
+    request: Request,
+    response: Response,
+    current_user: Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    Obtém resumo do usuário para o dashboard pessoal
+    Obtém resumo do usuário para o dashboard pessoal.
+    Responde 304 se a versão de dados do usuário não mudou (If-None-Match).
     """
     try:
+        etag = dashboard_etag(current_user)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        set_etag_headers(response, etag)
+        
         user_id = current_user.id
         logger.info(f"Obtendo resumo para usuário: {user_id}")
         
@@ -226,14 +239,22 @@ async def get_user_summary(current_user: Usuario = Depends(get_current_user), db
 # Corrigido o Operation ID para evitar duplicação
 @router.get("/recent-activity", operation_id="get_dashboard_recent_activity", response_model=List[ActivityItem])
 async def get_recent_activity(
+    request: Request,
+    response: Response,
     limit: int = 10,
     current_user: Usuario = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Obtém atividades recentes do usuário
+    Obtém atividades recentes do usuário.
+    Responde 304 se a versão de dados do usuário não mudou (If-None-Match).
     """
     try:
+        etag = dashboard_etag(current_user)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        set_etag_headers(response, etag)
+        
         user_id = current_user.id
         logger.info(f"Obtendo atividades recentes para usuário: {user_id}")
         activities = []
@@ -324,9 +345,15 @@ async def get_recent_activity(
         )
 
 @router.get("/quick-stats", response_model=QuickStats)
-async def get_quick_stats(current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_quick_stats(
+    request: Request,
+    response: Response,
+    current_user: Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    Obtém estatísticas rápidas para cards do dashboard
+    Obtém estatísticas rápidas para cards do dashboard.
+    Para usuários comuns, responde 304 se a versão de dados não mudou (If-None-Match).
     """
     try:
         user_id = current_user.id
@@ -335,7 +362,7 @@ async def get_quick_stats(current_user: Usuario = Depends(get_current_user), db:
         # Se for admin, retorna estatísticas gerais
         is_admin = getattr(current_user, "is_admin", False) or getattr(current_user, "tipo_usuario", "") == "admin"
         if is_admin:
-            admin_stats = await get_admin_quick_stats(db)
+            admin_stats = await get_admin_quick_stats()
             # Converte para o formato esperado
             return QuickStats(
                 evolucao_peso=0.0,
@@ -345,16 +372,20 @@ async def get_quick_stats(current_user: Usuario = Depends(get_current_user), db:
             )
         
         # Para usuários comuns, retorna estatísticas pessoais
+        etag = dashboard_etag(current_user)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        set_etag_headers(response, etag)
+        
         # Progresso: diferença entre primeira e última medição de peso
         try:
-            progress_entries = db.query(Progresso.peso, Progresso.data_medicao).filter(
-                Progresso.usuario_id == user_id
-            ).order_by(Progresso.data_medicao).all()
+            resumo = calcular_resumo_progresso(db, user_id)
             
             evolucao_peso = 0.0
-            if progress_entries and len(progress_entries) > 1:
-                primeiro = progress_entries[0].peso
-                ultimo = progress_entries[-1].peso
+            progresso_total = resumo.total_medicoes if resumo else 0
+            if resumo and progresso_total > 1:
+                primeiro = resumo.peso_inicial
+                ultimo = resumo.peso_atual
                 if primeiro is not None and ultimo is not None:
                     try:
                         evolucao_peso = float(ultimo) - float(primeiro)
@@ -363,7 +394,7 @@ async def get_quick_stats(current_user: Usuario = Depends(get_current_user), db:
         except Exception as e:
             logger.warning(f"Erro ao buscar progresso: {str(e)}")
             evolucao_peso = 0.0
-            progress_entries = []
+            progresso_total = 0
         
         # Dias desde o cadastro
         try:
@@ -391,7 +422,7 @@ async def get_quick_stats(current_user: Usuario = Depends(get_current_user), db:
             "evolucao_peso": round(evolucao_peso, 1),
             "dias_cadastrado": dias_cadastrado,
             "treinos_mes": treinos_mes,
-            "progresso_total": len(progress_entries) if progress_entries else 0
+            "progresso_total": progresso_total
         }
     except Exception as e:
         logger.error(f"Erro ao buscar estatísticas rápidas: {str(e)}", exc_info=True)
@@ -400,22 +431,19 @@ async def get_quick_stats(current_user: Usuario = Depends(get_current_user), db:
             detail=f"Erro ao buscar estatísticas rápidas: {str(e)}"
         )
 
-async def get_admin_quick_stats(db: Session):
+async def get_admin_quick_stats():
     """
     Função auxiliar para obter estatísticas rápidas para admins.
+    As contagens são independentes e rodam em paralelo, cada uma em sua própria conexão.
     """
     try:
-        novos_usuarios = db.query(Usuario).filter(Usuario.created_at >= (datetime.now() - timedelta(days=30))).count()
-        treinos_enviados = db.query(TreinoEnviado).filter(TreinoEnviado.enviado_em >= (datetime.now() - timedelta(days=30))).count()
-        mensagens_pendentes = db.query(Mensagem).filter(Mensagem.lida == False).count()
-        avaliacoes_pendentes = db.query(Avaliacao).filter(Avaliacao.status == "pendente").count()
-
-        return {
-            "novos_usuarios": novos_usuarios,
-            "treinos_enviados": treinos_enviados,
-            "mensagens_pendentes": mensagens_pendentes,
-            "avaliacoes_pendentes": avaliacoes_pendentes
-        }
+        trinta_dias_atras = datetime.now() - timedelta(days=30)
+        return await run_queries_concurrently({
+            "novos_usuarios": lambda db: db.query(func.count(Usuario.id)).filter(Usuario.created_at >= trinta_dias_atras).scalar(),
+            "treinos_enviados": lambda db: db.query(func.count(TreinoEnviado.id)).filter(TreinoEnviado.enviado_em >= trinta_dias_atras).scalar(),
+            "mensagens_pendentes": lambda db: db.query(func.count(Mensagem.id)).filter(Mensagem.lida == False).scalar(),
+            "avaliacoes_pendentes": lambda db: db.query(func.count(Avaliacao.id)).filter(Avaliacao.status == "pendente").scalar()
+        })
     except Exception as e:
         logger.error(f"Erro ao buscar estatísticas rápidas do admin: {str(e)}", exc_info=True)
         raise HTTPException(
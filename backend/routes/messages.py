@@ -1,38 +1,228 @@
 from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional, Set, Union
+import os
+import orjson
 import asyncio
-from datetime import datetime
+import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from starlette.concurrency import run_in_threadpool
 
 from routes.auth import get_current_user, get_admin_user
-from src.core.database import get_db
-from src.schemas.models import Mensagem, Usuario # Importar Usuario ao invés de Profile
-from src.schemas.message import MessageCreate, MessageResponse # Importar os schemas de mensagem
+from src.core.auth_utils import decode_access_token
+from src.core.data_version import current_data_version, decode_sync_token, encode_sync_token
+from src.core.database import SessionLocal, get_db
+from src.schemas.models import Conversa, Mensagem, Usuario # Importar Usuario ao invés de Profile
+from src.schemas.message import ConversationPage, MessageCreate, MessagePage, MessageResponse, MessageSyncPage # Importar os schemas de mensagem
+from src.core.pubsub import BROADCAST_CHANNEL, PRESENCE_TTL_SECONDS, PubSub, create_pubsub, worker_channel
+from src.core import conversations, ws_codec
+from src.core.ws_codec import Frame
+from src.core.message_ingest import ingest
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Limites de envio por conexão (um cliente lento não pode segurar os outros nem acumular memória)
+SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", 100))
+SEND_TIMEOUT_SECONDS = float(os.environ.get("WS_SEND_TIMEOUT_SECONDS", 10))
+
+# O que fazer quando a fila de envio de uma conexão enche:
+# "disconnect" fecha o socket (o cliente reconecta e busca o histórico),
+# "drop_oldest" descarta o evento mais antigo da fila, "drop_newest" descarta o novo
+SLOW_CONSUMER_POLICIES = ("disconnect", "drop_oldest", "drop_newest")
+SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "disconnect")
+
+# 1013 = "try again later"
+WS_CLOSE_SLOW_CONSUMER = 1013
+
+class Connection:
+    """Um socket com fila de envio limitada (de Frames) e uma tarefa que escreve nele"""
+    def __init__(self, websocket: WebSocket, user_id: str, encoding: str = ws_codec.JSON, policy: str = SLOW_CONSUMER_POLICY):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"WS_SLOW_CONSUMER_POLICY inválida: {policy}")
+        self.websocket = websocket
+        self.user_id = user_id
+        self.encoding = encoding
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.dropped = 0
+        self.closed = False
+        self._writer: Optional[asyncio.Task] = None
+    
+    def start(self):
+        self._writer = asyncio.create_task(self._write())
+    
+    async def _write(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                # Cada formato é codificado uma vez por Frame e reaproveitado pelas outras conexões
+                await asyncio.wait_for(ws_codec.send(self.websocket, frame, self.encoding), SEND_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket de {self.user_id} não recebeu em {SEND_TIMEOUT_SECONDS}s; fechando")
+            await self._close_socket(WS_CLOSE_SLOW_CONSUMER)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket já fechado pelo cliente; o loop de leitura cuida da desconexão
+            self.closed = True
+    
+    def send_frame(self, frame: Frame) -> bool:
+        """Enfileira sem bloquear; aplica a política se a fila estiver cheia. Retorna se enfileirou."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            pass
+        
+        self.dropped += 1
+        if self.policy == "drop_newest":
+            return False
+        if self.policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(frame)
+            return True
+        logger.warning(f"Fila de envio do WebSocket de {self.user_id} cheia; desconectando")
+        self.close_nowait(WS_CLOSE_SLOW_CONSUMER)
+        return False
+    
+    def send(self, message: Dict[str, Any]) -> bool:
+        return self.send_frame(Frame(message))
+    
+    async def receive(self) -> Dict[str, Any]:
+        return await ws_codec.receive(self.websocket, self.encoding)
+    
+    def close_nowait(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer:
+            self._writer.cancel()
+        asyncio.create_task(self._close_socket(code))
+    
+    async def _close_socket(self, code: int):
+        self.closed = True
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+    
+    async def stop(self):
+        self.closed = True
+        if self._writer:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._writer = None
+
 # Gerenciador de conexões WebSocket
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+    """
+    Sockets conectados a este worker (vários por usuário: abas e dispositivos).
+    Eventos para usuários conectados em outro worker seguem pelo pub/sub
+    (src/core/pubsub.py), que também guarda a presença.
+    """
+    def __init__(self, pubsub: Optional[PubSub] = None):
+        self.active_connections: Dict[str, Set[Connection]] = {}
+        self.pubsub = pubsub or create_pubsub()
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        self._presence_task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Assina os canais deste worker (idempotente; chamado no startup e na primeira conexão)"""
+        async with self._start_lock:
+            if self._started:
+                return
+            await self.pubsub.start(self._on_event)
+            self._presence_task = asyncio.create_task(self._refresh_presence())
+            self._started = True
+    
+    async def stop(self):
+        if self._presence_task:
+            self._presence_task.cancel()
+            self._presence_task = None
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                await connection.stop()
+        self.active_connections.clear()
+        if self._started:
+            await self.pubsub.close()
+            self._started = False
+    
+    async def _refresh_presence(self):
+        # Renova a presença antes de expirar; se o worker cair, ela some sozinha
+        while True:
+            await asyncio.sleep(PRESENCE_TTL_SECONDS / 3)
+            try:
+                await self.pubsub.set_presence(set(self.active_connections))
+            except Exception as e:
+                logger.error(f"Erro ao renovar presença do WebSocket: {e}")
+    
+    async def _on_event(self, channel: str, event: Dict[str, Any]):
+        # O JSON já vem codificado pelo worker de origem
+        frame = Frame.from_json(event["frame"])
+        if event["kind"] == "broadcast":
+            self._broadcast_local(frame)
+        else:
+            self._send_local(frame, event["user_id"])
     
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
+    async def connect(self, websocket: WebSocket, user_id: str) -> Connection:
+        await self.start()
+        encoding, subprotocol = ws_codec.negotiate(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(websocket, user_id, encoding)
+        connection.start()
+        first = user_id not in self.active_connections
+        self.active_connections.setdefault(user_id, set()).add(connection)
+        if first:
+            await self.pubsub.set_presence({user_id})
+        return connection
     
-    async def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    async def disconnect(self, connection: Connection):
+        await connection.stop()
+        connections = self.active_connections.get(connection.user_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.active_connections[connection.user_id]
+            await self.pubsub.clear_presence(connection.user_id)
+    
+    def is_connected_here(self, user_id: str) -> bool:
+        return user_id in self.active_connections
+    
+    def _send_local(self, frame: Frame, user_id: str) -> int:
+        """Enfileira para todos os sockets do usuário neste worker; retorna quantos"""
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            return 0
+        return sum(connection.send_frame(frame) for connection in list(connections))
+    
+    def _broadcast_local(self, frame: Frame):
+        # Só enfileira: cada conexão escreve na sua própria tarefa, em paralelo
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                connection.send_frame(frame)
     
     async def send_personal_message(self, message: Dict[str, Any], user_id: str):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(json.dumps(message))
+        """Entrega a todos os sockets do usuário, neste worker e (via pub/sub) nos outros onde ele está conectado"""
+        frame = Frame(message)
+        self._send_local(frame, user_id)
+        for worker_id in await self.pubsub.workers_for(user_id):
+            if worker_id != self.pubsub.worker_id:
+                await self.pubsub.publish(
+                    worker_channel(worker_id),
+                    {"kind": "personal", "user_id": user_id, "frame": frame.text}
+                )
     
     async def broadcast(self, message: Dict[str, Any]):
-        for connection in self.active_connections.values():
-            await connection.send_text(json.dumps(message))
+        # O próprio worker também assina o canal de broadcast; o evento é codificado uma vez só
+        await self.pubsub.publish(BROADCAST_CHANNEL, {"kind": "broadcast", "frame": Frame(message).text})
 
 manager = ConnectionManager()
 
@@ -49,13 +239,46 @@ async def get_admin_profile(db: Session = Depends(get_db)):
         )
     return admin_user
 
+# Páginas de histórico de conversa e da lista de conversas
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 200
+
+async def _resolve_other_user(other_user_id: str, db: Session) -> Usuario:
+    """Usuário da outra ponta da conversa ("admin" é resolvido para o administrador)"""
+    if other_user_id == "admin":
+        return await get_admin_profile(db)
+    
+    other_user = db.query(Usuario).filter(Usuario.id == other_user_id).first()
+    
+    if not other_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Usuário não encontrado"
+        )
+    return other_user
+
+def _new_message_event(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "new_message",
+        "data": {
+            "id": message["id"],
+            "sender_id": message["sender_id"],
+            "receiver_id": message["receiver_id"],
+            "conversation_id": message["conversation_id"],
+            "usuario_id": message["receiver_id"],
+            "assunto": message.get("assunto"),
+            "conteudo": message["conteudo"],
+            "enviado_em": message["enviado_em"].isoformat()
+        }
+    }
+
 @router.post("/", response_model=MessageResponse)
 async def create_message(message: MessageCreate, current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
     """
-    Cria uma nova mensagem.
+    Cria uma nova mensagem do usuário atual para `receiver_id`.
     """
     # Verificar se o destinatário existe
-    receiver = db.query(Usuario).filter(Usuario.id == message.usuario_id).first()
+    receiver = db.query(Usuario).filter(Usuario.id == message.receiver_id).first()
     
     if not receiver:
         raise HTTPException(
@@ -63,86 +286,140 @@ async def create_message(message: MessageCreate, current_user: Usuario = Depends
             detail="Destinatário não encontrado"
         )
     
-    # Inserir a mensagem
-    db_message = Mensagem(
-        usuario_id=message.usuario_id,
-        assunto=message.assunto,
-        conteudo=message.conteudo,
-        enviado_em=datetime.now()
-    )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    # Mesma fila do WebSocket: grava a mensagem e atualiza a conversa na mesma transação
+    values = {
+        "sender_id": str(current_user.id),
+        "receiver_id": str(receiver.id),
+        "assunto": message.assunto,
+        "conteudo": message.conteudo
+    }
+    message_id, enviado_em = await ingest.submit(values)
+    created = {
+        **values,
+        "id": message_id,
+        "enviado_em": enviado_em,
+        "usuario_id": values["receiver_id"],
+        "conversation_id": conversations.conversation_id(values["sender_id"], values["receiver_id"]),
+        "lida": False,
+        "respondida": False
+    }
     
     # Tentar enviar a mensagem via WebSocket se o destinatário estiver conectado
     try:
-        await manager.send_personal_message(
-            {
-                "type": "new_message",
-                "data": {
-                    "id": db_message.id,
-                    "usuario_id": db_message.usuario_id,
-                    "assunto": db_message.assunto,
-                    "conteudo": db_message.conteudo,
-                    "enviado_em": db_message.enviado_em.isoformat()
-                }
-            },
-            message.usuario_id # Assuming usuario_id is the receiver_id here
-        )
+        await manager.send_personal_message(_new_message_event(created), values["receiver_id"])
     except Exception as e:
         # Ignorar erros de WebSocket, a mensagem já foi salva no banco
         print(f"Erro ao enviar mensagem via WebSocket: {e}")
     
-    return db_message
+    return created
 
-@router.get("/", response_model=List[MessageResponse])
-async def get_my_messages(current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
+@router.get("/", response_model=Union[MessageSyncPage, List[MessageResponse]])
+async def get_my_messages(
+    since: Optional[str] = None,
+    current_user: Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
     Obtém todas as mensagens do usuário atual.
+    
+    Sincronização incremental: `?since=` (vazio) retorna a caixa inteira e um
+    `sync_token`; `?since=<sync_token>` retorna só as mensagens criadas ou
+    alteradas (lidas, respondidas) depois do token, e um novo token. Cada
+    consulta com token é uma leitura de intervalo em ix_mensagens_usuario_sync.
+    Mensagens excluídas não aparecem na sincronização incremental.
     """
-    messages = db.query(Mensagem).filter(Mensagem.usuario_id == current_user.id).order_by(Mensagem.enviado_em.desc()).all()
+    if since is None:
+        messages = db.query(Mensagem).filter(Mensagem.usuario_id == current_user.id).order_by(Mensagem.enviado_em.desc()).all()
+        return messages or []
     
-    return messages or []
+    # Token lido antes das mensagens: o que for gravado entre as duas consultas
+    # tem versão maior e vem na próxima sincronização
+    version = current_data_version(db, current_user.id)
+    query = db.query(Mensagem).filter(Mensagem.usuario_id == current_user.id)
+    
+    if since:
+        since_version = decode_sync_token(since)
+        if since_version >= version:
+            return {"items": [], "sync_token": encode_sync_token(max(since_version, version))}
+        query = query.filter(Mensagem.sync_version > since_version, Mensagem.sync_version <= version)
+    
+    messages = query.order_by(Mensagem.sync_version, Mensagem.id).all()
+    return {"items": messages, "sync_token": encode_sync_token(version)}
 
-@router.get("/api/conversation/{other_user_id}", response_model=List[MessageResponse])
+@router.get("/conversations", response_model=ConversationPage)
+async def get_my_conversations(
+    cursor: Optional[str] = None,
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user: Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Conversas do usuário atual, da última mensagem mais recente para a mais
+    antiga, com a prévia da última mensagem e as não lidas.
+    Para a próxima página, envie o `next_cursor` recebido como `cursor`.
+    """
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    rows, next_cursor = conversations.for_user(db, current_user.id, cursor, limit)
+    
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "other_user_id": conversations.other_participant(row, current_user.id),
+                "last_message_id": row.last_message_id,
+                "last_message_preview": row.last_message_preview,
+                "last_sender_id": row.last_sender_id,
+                "last_message_at": row.last_message_at,
+                "unread_count": conversations.unread_for(row, current_user.id)
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor
+    }
+
+@router.get("/conversation/{other_user_id}", response_model=MessagePage)
 async def get_conversation(
     other_user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = LIST_DEFAULT_LIMIT,
     current_user: Usuario = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Obtém a conversa entre o usuário atual e outro usuário.
+    Mensagens trocadas entre o usuário atual e outro usuário ("admin" para o
+    administrador), da mais recente para a mais antiga, paginadas por cursor.
+    Para a próxima página, envie o `next_cursor` recebido como `cursor`.
     
-    NOTA: O modelo Mensagem atual (com apenas 'usuario_id' como destinatário)
-    não permite uma representação completa de uma conversa bidirecional (remetente/destinatário).
-    Esta implementação retorna todas as mensagens onde o usuário atual OU o outro usuário
-    é o destinatário. Para uma conversa completa, o modelo Mensagem precisaria de 'sender_id' e 'receiver_id'.
+    Cada página é uma leitura de intervalo em ix_mensagens_conversa_data
+    ((enviado_em, id) < cursor, ver pagination.keyset_page), intercalada com as
+    mensagens antigas sem conversa recebidas pelo usuário atual
+    (ix_mensagens_legado_usuario_data).
     """
-    target_user_id = other_user_id
-
-    if other_user_id == "admin":
-        admin_profile = await get_admin_profile(db)
-        target_user_id = admin_profile.id
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    other_user = await _resolve_other_user(other_user_id, db)
     
-    # Verificar se o usuário alvo existe (seja o ID original ou o ID do admin resolvido)
-    other_user = db.query(Usuario).filter(Usuario.id == target_user_id).first()
+    messages, next_cursor = conversations.thread(db, current_user.id, other_user.id, cursor, limit)
     
-    if not other_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Usuário não encontrado"
-        )
+    return {"items": messages, "next_cursor": next_cursor}
+
+@router.put("/conversation/{other_user_id}/read")
+async def mark_conversation_as_read(
+    other_user_id: str,
+    current_user: Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Marca como lidas todas as mensagens recebidas de outro usuário e zera as não lidas da conversa.
+    """
+    other_user = await _resolve_other_user(other_user_id, db)
+    conversation = db.get(Conversa, conversations.conversation_id(current_user.id, other_user.id))
     
-    # Consulta para mensagens onde o destinatário é o usuário atual OU o usuário alvo
-    # Esta é uma solução paliativa devido à limitação do modelo Mensagem.
-    messages = db.query(Mensagem).filter(
-        or_(
-            Mensagem.usuario_id == current_user.id,
-            Mensagem.usuario_id == target_user_id
-        )
-    ).order_by(Mensagem.enviado_em.asc()).all()
+    updated = 0
+    if conversation is not None:
+        updated = conversations.mark_read(db, conversation, current_user.id)
+        db.commit()
     
-    return messages or []
+    return {"success": True, "updated": updated}
 
 @router.put("/read/{message_id}")
 async def mark_message_as_read(message_id: str, current_user: Usuario = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -158,84 +435,136 @@ async def mark_message_as_read(message_id: str, current_user: Usuario = Depends(
             detail="Mensagem não encontrada ou você não tem permissão para acessá-la"
         )
     
-    # Marcar como lida (assuming a field like 'is_read' exists in Mensagem model)
-    # message.is_read = True
-    # db.commit()
-    # db.refresh(message)
+    if not message.lida:
+        message.lida = True
+        conversations.message_read(db, message)
+        db.commit()
     
     return {"success": True, "message": "Mensagem marcada como lida"}
 
+# Tarefas de gravação/entrega em andamento (referência forte até terminarem)
+_pending_tasks: Set[asyncio.Task] = set()
+
+def _spawn(coroutine):
+    task = asyncio.create_task(coroutine)
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+
+def _user_exists(user_id: str) -> bool:
+    """Consulta pela chave primária em sessão própria (o socket não segura sessão de banco)"""
+    with SessionLocal() as db:
+        return db.query(Usuario.id).filter(Usuario.id == user_id).first() is not None
+
+def _authenticated(token: Optional[str], user_id: str) -> bool:
+    """O JWT é válido, é do usuário do caminho e o usuário existe"""
+    payload = decode_access_token(token) if token else None
+    if not payload or str(payload.get("sub")) != user_id:
+        return False
+    return _user_exists(user_id)
+
+def _valid_message_data(msg_data: Dict[str, Any]) -> bool:
+    """Tipos aceitos antes de entrar na fila (um valor inválido faria o INSERT do lote falhar)"""
+    return (
+        isinstance(msg_data["receiver_id"], str) and msg_data["receiver_id"] != ""
+        and isinstance(msg_data["content"], str)
+    )
+
+async def _persist_and_deliver(connection: Connection, msg_data: Dict[str, Any]):
+    """Grava pela fila de lotes e, depois do commit, confirma ao remetente e entrega ao destinatário"""
+    # Mesma verificação de create_message, antes de entrar na fila
+    if not await run_in_threadpool(_user_exists, msg_data["receiver_id"]):
+        connection.send({"error": "Destinatário não encontrado", "client_id": msg_data.get("client_id")})
+        return
+    
+    values = {
+        "sender_id": connection.user_id,
+        "receiver_id": msg_data["receiver_id"],
+        "assunto": "Mensagem WebSocket", # Default subject for WebSocket messages
+        "conteudo": msg_data["content"]
+    }
+    try:
+        message_id, enviado_em = await ingest.submit(values)
+    except Exception:
+        # Só a mensagem genérica: o erro do banco pode trazer dados de outras mensagens do lote (fica no log)
+        connection.send({"error": "Erro ao gravar mensagem", "client_id": msg_data.get("client_id")})
+        return
+    
+    conversation_id = conversations.conversation_id(values["sender_id"], values["receiver_id"])
+    
+    # Confirmar para o remetente (client_id, se enviado, permite casar com a mensagem local)
+    connection.send({
+        "type": "message_sent",
+        "data": {
+            "id": message_id,
+            "client_id": msg_data.get("client_id"),
+            "conversation_id": conversation_id,
+            "timestamp": enviado_em.isoformat()
+        }
+    })
+    
+    # Enviar para o destinatário se estiver conectado (neste ou em outro worker)
+    try:
+        await manager.send_personal_message(
+            _new_message_event({**values, "id": message_id, "enviado_em": enviado_em, "conversation_id": conversation_id}),
+            msg_data["receiver_id"]
+        )
+    except Exception as e:
+        # A mensagem já foi gravada e confirmada; o destinatário a recebe ao buscar o histórico
+        logger.error(f"Erro ao entregar mensagem via WebSocket: {e}")
+
 @router.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, user_id: str, token: Optional[str] = None):
     """
     Endpoint WebSocket para comunicação em tempo real.
+    JSON em frames de texto, ou msgpack em frames binários se o cliente pedir o
+    subprotocolo "msgpack" (ver src/core/ws_codec.py).
+    
+    Exige `?token=<JWT>` do próprio `user_id` (o remetente das mensagens é o
+    usuário do caminho); sem ele a conexão é recusada com 1008.
+    
+    O socket não segura sessão de banco: mensagens vão para a fila de gravação em
+    lote (src/core/message_ingest.py) e `message_sent` só é enviado após o commit.
     """
-    await manager.connect(websocket, user_id)
+    if not await run_in_threadpool(_authenticated, token, user_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    connection = await manager.connect(websocket, user_id)
     try:
         while True:
-            data = await websocket.receive_text()
             try:
-                message_data = json.loads(data)
+                message_data = await connection.receive()
                 
                 # Validar a mensagem
                 if "type" not in message_data or "data" not in message_data:
-                    await websocket.send_text(json.dumps({"error": "Formato de mensagem inválido"}))
+                    connection.send({"error": "Formato de mensagem inválido"})
                     continue
                 
                 # Processar diferentes tipos de mensagens
                 if message_data["type"] == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
+                    connection.send({"type": "pong"})
                 
                 elif message_data["type"] == "message":
                     msg_data = message_data["data"]
-                    if "receiver_id" in msg_data and "content" in msg_data:
-                        # Inserir a mensagem no banco
-                        db_message = Mensagem(
-                            usuario_id=msg_data["receiver_id"], # Assuming receiver_id is stored as usuario_id
-                            assunto="Mensagem WebSocket", # Default subject for WebSocket messages
-                            conteudo=msg_data["content"],
-                            enviado_em=datetime.now()
-                        )
-                        db.add(db_message)
-                        db.commit()
-                        db.refresh(db_message)
-                        
-                        if db_message:
-                            # Enviar para o destinatário se estiver conectado
-                            await manager.send_personal_message(
-                                {
-                                    "type": "new_message",
-                                    "data": {
-                                        "id": db_message.id,
-                                        "usuario_id": db_message.usuario_id,
-                                        "assunto": db_message.assunto,
-                                        "conteudo": db_message.conteudo,
-                                        "enviado_em": db_message.enviado_em.isoformat()
-                                    }
-                                },
-                                msg_data["receiver_id"]
-                            )
-                            
-                            # Confirmar para o remetente
-                            await websocket.send_text(json.dumps({
-                                "type": "message_sent",
-                                "data": {
-                                    "id": db_message.id,
-                                    "timestamp": db_message.enviado_em.isoformat()
-                                }
-                            }))
+                    if not isinstance(msg_data, dict) or "receiver_id" not in msg_data or "content" not in msg_data:
+                        connection.send({"error": "Dados de mensagem incompletos"})
+                    elif not _valid_message_data(msg_data):
+                        connection.send({"error": "Dados de mensagem inválidos", "client_id": msg_data.get("client_id")})
                     else:
-                        await websocket.send_text(json.dumps({"error": "Dados de mensagem incompletos"}))
+                        # Gravação em lote fora do loop de leitura: o socket continua recebendo
+                        _spawn(_persist_and_deliver(connection, msg_data))
                 
-            except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({"error": "JSON inválido"}))
+            except WebSocketDisconnect:
+                raise
+            except orjson.JSONDecodeError:
+                connection.send({"error": "JSON inválido"})
             except Exception as e:
-                await websocket.send_text(json.dumps({"error": str(e)}))
+                connection.send({"error": str(e)})
     
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        await manager.disconnect(connection)
     except Exception as e:
         print(f"Erro no WebSocket: {e}")
-        manager.disconnect(user_id)
+        await manager.disconnect(connection)
 
 
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import logging
@@ -7,6 +7,8 @@ from pydantic import BaseModel, EmailStr
 from datetime import datetime
 
 from src.core.database import get_db
+from src.core import images
+from src.core.storage import get_storage_client
 from routes.auth import get_current_user, get_admin_user
 from src.core.models import Usuario
 from src.schemas.user import ProfileUpdate
@@ -33,6 +35,13 @@ class ProfileResponse(BaseModel):
         # Para Pydantic v2, use:
         # model_config = {"from_attributes": True}
 
+class AvatarResponse(BaseModel):
+    url: Optional[str] = None
+    srcset: Optional[Dict[str, Any]] = None  # variantes WebP/JPEG; None até ficarem prontas
+
+def _avatar_response(usuario: Usuario) -> AvatarResponse:
+    return AvatarResponse(url=usuario.avatar_url, srcset=images.srcset_for_url(usuario.avatar_url))
+
 # ----------------------------
 # Obter perfil do usuário atual
 # ----------------------------
@@ -89,6 +98,54 @@ async def update_my_profile(
             detail=f"Erro ao atualizar perfil: {str(e)}"
         )
 
+# ----------------------------
+# Avatar do usuário atual (variantes geradas em segundo plano)
+# ----------------------------
+@router.post("/me/avatar", response_model=AvatarResponse)
+async def upload_my_avatar(
+    file: UploadFile = File(...),
+    current_user: Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        data = await file.read()
+        try:
+            relative_path = images.save_original("avatars", current_user.id, data, file.content_type)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        profile = db.query(Usuario).filter(Usuario.id == current_user.id).first()
+        profile.avatar_url = get_storage_client().get_public_url("avatars", relative_path)
+        db.commit()
+        images.schedule_variants("avatars", relative_path)
+        
+        return _avatar_response(profile)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao enviar avatar: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao enviar avatar: {str(e)}"
+        )
+
+@router.get("/{user_id}/avatar", response_model=AvatarResponse)
+async def get_avatar(
+    user_id: str,
+    current_user: Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    profile = db.query(Usuario).filter(Usuario.id == user_id).first()
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil não encontrado"
+        )
+    return _avatar_response(profile)
+
 # ----------------------------
 # Obter perfil por ID (com permissão)
 # ----------------------------
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 from datetime import date
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, true
 
 from src.core.database import get_db
 from routes.auth import get_current_user
@@ -12,6 +12,39 @@ from src.core.models import Usuario
 # ✅ Adiciona prefixo "/progress" para funcionar com o frontend
 router = APIRouter(prefix="/progress", tags=["Progresso"])
 
+def calcular_resumo_progresso(db: Session, usuario_id: str):
+    """
+    Retorna a primeira e a última medição do usuário e o total de medições
+    em uma única consulta.
+
+    A primeira e a última linha vêm de subconsultas ordenadas com LIMIT 1
+    (servidas pelo índice (usuario_id, data_medicao)), então o custo não
+    cresce com o histórico. Retorna None se o usuário não tiver medições.
+    """
+    base = select(
+        Progresso.data_medicao,
+        Progresso.peso,
+        Progresso.percentual_gordura
+    ).where(Progresso.usuario_id == usuario_id)
+
+    primeira = base.order_by(Progresso.data_medicao.asc()).limit(1).subquery("primeira")
+    ultima = base.order_by(Progresso.data_medicao.desc()).limit(1).subquery("ultima")
+    total = select(func.count(Progresso.id)).where(
+        Progresso.usuario_id == usuario_id
+    ).scalar_subquery()
+
+    stmt = select(
+        total.label("total_medicoes"),
+        primeira.c.data_medicao.label("primeira_medicao"),
+        primeira.c.peso.label("peso_inicial"),
+        primeira.c.percentual_gordura.label("gordura_inicial"),
+        ultima.c.data_medicao.label("ultima_medicao"),
+        ultima.c.peso.label("peso_atual"),
+        ultima.c.percentual_gordura.label("gordura_atual")
+    ).select_from(primeira).join(ultima, true())
+
+    return db.execute(stmt).first()
+
 @router.get("/", response_model=List[ProgressoResponse])
 async def get_my_progress(
     skip: int = 0,
@@ -169,9 +202,9 @@ async def get_progress_summary(
 ):
     """Obtém um resumo estatístico do progresso do usuário"""
     try:
-        medicoes = db.query(Progresso).filter(Progresso.usuario_id == current_user.id).order_by(Progresso.data_medicao.asc()).all()
+        resumo = calcular_resumo_progresso(db, current_user.id)
         
-        if not medicoes:
+        if not resumo:
             return {
                 "total_medicoes": 0,
                 "primeira_medicao": None,
@@ -180,26 +213,23 @@ async def get_progress_summary(
                 "evolucao_gordura": None
             }
         
-        primeira = medicoes[0]
-        ultima = medicoes[-1]
-        
         evolucao_peso = (
-            ultima.peso - primeira.peso
-            if primeira.peso is not None and ultima.peso is not None else None
+            resumo.peso_atual - resumo.peso_inicial
+            if resumo.peso_inicial is not None and resumo.peso_atual is not None else None
         )
         evolucao_gordura = (
-            ultima.percentual_gordura - primeira.percentual_gordura
-            if primeira.percentual_gordura is not None and ultima.percentual_gordura is not None else None
+            resumo.gordura_atual - resumo.gordura_inicial
+            if resumo.gordura_inicial is not None and resumo.gordura_atual is not None else None
         )
         
         return {
-            "total_medicoes": len(medicoes),
-            "primeira_medicao": primeira.data_medicao,
-            "ultima_medicao": ultima.data_medicao,
+            "total_medicoes": resumo.total_medicoes,
+            "primeira_medicao": resumo.primeira_medicao,
+            "ultima_medicao": resumo.ultima_medicao,
             "evolucao_peso": evolucao_peso,
             "evolucao_gordura": evolucao_gordura,
-            "peso_atual": ultima.peso,
-            "gordura_atual": ultima.percentual_gordura
+            "peso_atual": resumo.peso_atual,
+            "gordura_atual": resumo.gordura_atual
         }
     except Exception as e:
         raise HTTPException(
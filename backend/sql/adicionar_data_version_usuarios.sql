@@ -0,0 +1,10 @@
+-- ========================================
+-- VERSÃO DE DADOS POR USUÁRIO (ETags do dashboard)
+-- Necessário em bancos criados antes da coluna existir no modelo
+-- (create_all não altera tabelas existentes)
+-- ========================================
+
+-- Incrementada pela aplicação a cada escrita em treinos, progresso,
+-- mensagens, avaliações ou assinaturas do usuário
+ALTER TABLE public.usuarios
+    ADD COLUMN IF NOT EXISTS data_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,7 @@
+-- ========================================
+-- AVATAR DOS USUÁRIOS
+-- URL da imagem original; as variantes responsivas ficam ao lado dela no
+-- bucket avatars (ver src/core/images.py)
+-- ========================================
+
+ALTER TABLE public.usuarios ADD COLUMN IF NOT EXISTS avatar_url VARCHAR;
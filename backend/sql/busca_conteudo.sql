@@ -0,0 +1,16 @@
+-- ========================================
+-- BUSCA TEXTUAL EM CONTEÚDOS (GET /content/search)
+-- Coluna tsvector gerada a partir de título (peso A), resumo (B) e corpo (C)
+-- com a configuração portuguese, e índice GIN para o operador @@
+-- ========================================
+
+ALTER TABLE public.content
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('portuguese', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('portuguese', coalesce(summary, '')), 'B') ||
+        setweight(to_tsvector('portuguese', coalesce(body, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_content_search_vector
+    ON public.content USING GIN (search_vector);
@@ -0,0 +1,17 @@
+-- ========================================
+-- BUSCA APROXIMADA DE USUÁRIOS (pg_trgm)
+-- Usada por /admin/users/search; também acelera os filtros ILIKE
+-- de /admin/users, /profiles e /usuarios
+-- ========================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Índices GIN de trigramas: servem o operador % (similaridade) e ILIKE '%termo%'
+CREATE INDEX IF NOT EXISTS ix_usuarios_nome_trgm
+    ON public.usuarios USING gin (nome gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_usuarios_email_trgm
+    ON public.usuarios USING gin (email gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_usuarios_cidade_trgm
+    ON public.usuarios USING gin (cidade gin_trgm_ops);
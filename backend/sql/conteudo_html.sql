@@ -0,0 +1,11 @@
+-- ========================================
+-- CORPO RENDERIZADO DOS CONTEÚDOS
+-- HTML sanitizado e resumo em texto puro gerados na escrita a partir do Markdown
+-- (create_all não altera tabelas existentes)
+-- ========================================
+
+ALTER TABLE public.content ADD COLUMN IF NOT EXISTS body_html VARCHAR;
+ALTER TABLE public.content ADD COLUMN IF NOT EXISTS excerpt VARCHAR;
+
+-- Depois de aplicar, preencha os conteúdos existentes:
+--   python -m src.core.content_render
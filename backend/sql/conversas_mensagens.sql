@@ -0,0 +1,45 @@
+-- ========================================
+-- REMETENTE/DESTINATÁRIO E CONVERSAS DE MENSAGENS
+-- Mantidas por src/core/conversations.py
+-- ========================================
+
+ALTER TABLE public.mensagens ADD COLUMN IF NOT EXISTS sender_id VARCHAR;
+ALTER TABLE public.mensagens ADD COLUMN IF NOT EXISTS receiver_id VARCHAR;
+ALTER TABLE public.mensagens ADD COLUMN IF NOT EXISTS conversation_id VARCHAR;
+
+-- usuario_id sempre foi o destinatário; o remetente das mensagens antigas não
+-- foi gravado. Depois deste script, `python -m src.core.conversations` atribui
+-- ao administrador as que os clientes receberam e cria as conversas; as que o
+-- admin recebeu ficam sem conversa, no histórico dele.
+UPDATE public.mensagens SET receiver_id = usuario_id WHERE receiver_id IS NULL;
+
+-- Histórico paginado de uma conversa (keyset enviado_em desc, id desc)
+CREATE INDEX IF NOT EXISTS ix_mensagens_conversa_data
+    ON public.mensagens (conversation_id, enviado_em, id);
+
+-- Mensagens antigas sem conversa no histórico de quem as recebeu
+CREATE INDEX IF NOT EXISTS ix_mensagens_legado_usuario_data
+    ON public.mensagens (usuario_id, enviado_em, id)
+    WHERE conversation_id IS NULL;
+
+CREATE TABLE IF NOT EXISTS public.conversas (
+    id VARCHAR PRIMARY KEY,
+    usuario_a_id VARCHAR NOT NULL,
+    usuario_b_id VARCHAR NOT NULL,
+    last_message_id VARCHAR,
+    last_message_preview VARCHAR,
+    last_sender_id VARCHAR,
+    last_message_at TIMESTAMP,
+    unread_a INTEGER NOT NULL DEFAULT 0,
+    unread_b INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Lista de conversas de um usuário, da mais recente para a mais antiga
+-- (com id no fim: cada página é uma leitura de intervalo (last_message_at, id) < cursor)
+DROP INDEX IF EXISTS public.ix_conversas_usuario_a_ultima;
+CREATE INDEX ix_conversas_usuario_a_ultima
+    ON public.conversas (usuario_a_id, last_message_at, id);
+DROP INDEX IF EXISTS public.ix_conversas_usuario_b_ultima;
+CREATE INDEX ix_conversas_usuario_b_ultima
+    ON public.conversas (usuario_b_id, last_message_at, id);
@@ -0,0 +1,18 @@
+-- ========================================
+-- TABELA daily_metrics
+-- Snapshots diários das métricas do painel administrativo, gravados pelo
+-- job noturno (src/core/daily_metrics.py). Também criada pelo create_all.
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS public.daily_metrics (
+    day DATE NOT NULL,
+    metric VARCHAR NOT NULL,       -- signups, active_subscriptions, revenue, messages, progress_entries
+    dimension VARCHAR NOT NULL DEFAULT '',  -- plano_id em active_subscriptions
+    value DOUBLE PRECISION NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (day, metric, dimension)
+);
+
+-- Leituras por métrica em um intervalo de dias (séries do /analytics/users e do overview)
+CREATE INDEX IF NOT EXISTS ix_daily_metrics_metric_day
+    ON public.daily_metrics (metric, day);
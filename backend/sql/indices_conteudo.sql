@@ -0,0 +1,14 @@
+-- ========================================
+-- ÍNDICES DA TABELA content
+-- Necessário em bancos criados antes do índice existir no modelo
+-- (create_all não altera tabelas existentes)
+-- ========================================
+
+-- Listagem paginada por keyset em GET /content (published, created_at desc, id desc)
+CREATE INDEX IF NOT EXISTS ix_content_published_created
+    ON public.content (published, created_at, id);
+
+-- Comentários paginados por cursor (content_id, created_at desc, id desc) e
+-- comment_count agrupado por content_id nas listagens
+CREATE INDEX IF NOT EXISTS ix_comments_content_created
+    ON public.comments (content_id, created_at, id);
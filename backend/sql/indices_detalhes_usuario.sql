@@ -0,0 +1,30 @@
+-- ========================================
+-- ÍNDICES POR USUÁRIO E DATA
+-- Necessário em bancos criados antes dos índices existirem nos modelos
+-- (create_all não altera tabelas existentes)
+-- ========================================
+
+-- Atendem as contagens e a paginação por cursor (data, id) de
+-- /admin/users/{user_id}/details e /admin/users/{user_id}/details/{section}.
+-- O id no fim do índice deixa cada página ser uma leitura de intervalo
+-- ((data, id) < cursor), sem ordenar todas as linhas do usuário.
+-- DROP + CREATE recria índices antigos que não tinham a coluna id.
+DROP INDEX IF EXISTS public.ix_treinos_enviados_usuario_data;
+CREATE INDEX ix_treinos_enviados_usuario_data
+    ON public.treinos_enviados (usuario_id, enviado_em, id);
+
+DROP INDEX IF EXISTS public.ix_progresso_usuario_data;
+CREATE INDEX ix_progresso_usuario_data
+    ON public.progresso (usuario_id, data_medicao, id);
+
+DROP INDEX IF EXISTS public.ix_avaliacoes_usuario_data;
+CREATE INDEX ix_avaliacoes_usuario_data
+    ON public.avaliacoes (usuario_id, data, id);
+
+DROP INDEX IF EXISTS public.ix_mensagens_usuario_data;
+CREATE INDEX ix_mensagens_usuario_data
+    ON public.mensagens (usuario_id, enviado_em, id);
+
+DROP INDEX IF EXISTS public.ix_assinaturas_usuario_inicio;
+CREATE INDEX ix_assinaturas_usuario_inicio
+    ON public.assinaturas (usuario_id, data_inicio, id);
@@ -0,0 +1,10 @@
+-- ========================================
+-- ÍNDICES DA TABELA progresso
+-- Necessário em bancos criados antes do índice existir no modelo
+-- (create_all não altera tabelas existentes)
+-- ========================================
+
+-- Atende as subconsultas ordenadas (primeira/última medição) e o COUNT
+-- por usuário usados em /progress/stats/summary e /dashboard/quick-stats
+CREATE INDEX IF NOT EXISTS ix_progresso_usuario_data
+    ON public.progresso (usuario_id, data_medicao, id);
@@ -0,0 +1,11 @@
+-- ========================================
+-- SINCRONIZAÇÃO INCREMENTAL DA CAIXA DE ENTRADA
+-- GET /api/?since=<sync_token> (ver src/core/data_version.py)
+-- ========================================
+
+-- data_version do destinatário na última escrita da mensagem; as antigas ficam
+-- sem versão e só chegam ao cliente pela sincronização inicial (?since= vazio)
+ALTER TABLE public.mensagens ADD COLUMN IF NOT EXISTS sync_version INTEGER;
+
+CREATE INDEX IF NOT EXISTS ix_mensagens_usuario_sync
+    ON public.mensagens (usuario_id, sync_version);
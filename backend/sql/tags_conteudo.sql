@@ -0,0 +1,25 @@
+-- ========================================
+-- TAGS DE CONTEÚDO NORMALIZADAS (content_tags)
+-- Substitui a coluna content.tags (texto separado por vírgula)
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS public.content_tags (
+    content_id VARCHAR NOT NULL,
+    tag VARCHAR NOT NULL,
+    PRIMARY KEY (content_id, tag)
+);
+
+-- Filtro ?tag= (AND/OR) e contagem de facetas em /content/tags
+CREATE INDEX IF NOT EXISTS ix_content_tags_tag_content
+    ON public.content_tags (tag, content_id);
+
+-- Migra as tags existentes (minúsculas, sem espaços, sem repetidas)
+INSERT INTO public.content_tags (content_id, tag)
+SELECT DISTINCT c.id, lower(trim(t.tag))
+FROM public.content c
+CROSS JOIN LATERAL unnest(string_to_array(c.tags, ',')) AS t(tag)
+WHERE c.tags IS NOT NULL AND trim(t.tag) <> ''
+ON CONFLICT DO NOTHING;
+
+-- A coluna antiga não é mais lida pela API; remova depois de conferir a migração
+-- ALTER TABLE public.content DROP COLUMN tags;
@@ -0,0 +1,17 @@
+-- ========================================
+-- VISUALIZAÇÕES E POPULARIDADE DE CONTEÚDO
+-- Gravadas em lote por src/core/content_views.py
+-- ========================================
+
+ALTER TABLE public.content ADD COLUMN IF NOT EXISTS view_count INTEGER DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS public.content_views_daily (
+    content_id VARCHAR NOT NULL,
+    day DATE NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (content_id, day)
+);
+
+-- Montagem/atualização do ranking em memória (dias recentes de todos os conteúdos)
+CREATE INDEX IF NOT EXISTS ix_content_views_daily_day
+    ON public.content_views_daily (day);
@@ -0,0 +1,42 @@
+"""
+Ações executadas só depois do commit da sessão.
+
+Os eventos de mapper (after_insert/after_update/after_delete) rodam no flush,
+antes do commit. Quem mantém estado fora do banco (índices em memória) registra
+aqui o que fazer: a ação roda no after_commit e é descartada se a transação
+sofrer rollback, então o estado em memória nunca mostra linhas que não foram
+gravadas.
+"""
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_ACTIONS_KEY = "after_commit_actions"
+
+
+def defer(session: Optional[Session], action: Callable[[], None]) -> None:
+    """Agenda `action` para o commit de `session` (sem sessão, executa na hora)"""
+    if session is None:
+        action()
+        return
+    session.info.setdefault(_ACTIONS_KEY, []).append(action)
+
+
+def _run(session: Session) -> None:
+    for action in session.info.pop(_ACTIONS_KEY, []):
+        try:
+            action()
+        except Exception as e:
+            logger.error(f"Erro em ação pós-commit: {e}", exc_info=True)
+
+
+def _discard(session: Session) -> None:
+    session.info.pop(_ACTIONS_KEY, None)
+
+
+event.listen(Session, "after_commit", _run)
+event.listen(Session, "after_rollback", _discard)
@@ -0,0 +1,150 @@
+"""
+Agregações por período (dia, semana, mês) para os gráficos do painel administrativo.
+
+As contagens são feitas com um único GROUP BY sobre a coluna de data truncada
+(date_trunc no PostgreSQL, strftime no SQLite). Períodos já encerrados nunca
+mudam, então ficam em cache e só o período corrente é recalculado.
+"""
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from cachetools import LRUCache
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+GRANULARITIES = ("day", "week", "month")
+
+# Evita consultas gigantes (ex.: granularidade diária sobre vários anos)
+MAX_BUCKETS = 1000
+
+# (métrica, granularidade, início do período) -> valor de períodos encerrados
+_closed_period_cache: LRUCache = LRUCache(maxsize=8192)
+_cache_lock = threading.Lock()
+
+
+def truncate(value: datetime, granularity: str) -> datetime:
+    """Início do período que contém `value`"""
+    value = datetime(value.year, value.month, value.day)
+    if granularity == "day":
+        return value
+    if granularity == "week":
+        return value - timedelta(days=value.weekday())  # segunda-feira, como date_trunc('week')
+    if granularity == "month":
+        return value.replace(day=1)
+    raise ValueError(f"Granularidade inválida: {granularity}")
+
+
+def next_period(start: datetime, granularity: str) -> datetime:
+    """Início do período seguinte a `start` (já truncado)"""
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    raise ValueError(f"Granularidade inválida: {granularity}")
+
+
+def period_starts(start: datetime, end: datetime, granularity: str) -> List[datetime]:
+    """Inícios de todos os períodos que intersectam [start, end)"""
+    periods = []
+    current = truncate(start, granularity)
+    while current < end:
+        periods.append(current)
+        if len(periods) > MAX_BUCKETS:
+            raise ValueError(f"Intervalo grande demais: mais de {MAX_BUCKETS} períodos")
+        current = next_period(current, granularity)
+    return periods
+
+
+def period_label(start: datetime, granularity: str) -> str:
+    return start.strftime("%Y-%m") if granularity == "month" else start.strftime("%Y-%m-%d")
+
+
+def bucket_expression(column, granularity: str, dialect_name: str):
+    """Expressão SQL que trunca `column` no início do período"""
+    if dialect_name == "postgresql":
+        return func.date_trunc(granularity, column)
+    if dialect_name == "sqlite":
+        if granularity == "day":
+            return func.strftime("%Y-%m-%d", column)
+        if granularity == "week":
+            return func.date(column, "weekday 0", "-6 days")
+        return func.strftime("%Y-%m-01", column)
+    raise ValueError(f"Banco de dados não suportado para agregação por período: {dialect_name}")
+
+
+def as_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def count_by_period(
+    db: Session,
+    metric: str,
+    column,
+    start: datetime,
+    end: datetime,
+    granularity: str = "month",
+    filters: Sequence = (),
+    now: Optional[datetime] = None,
+    aggregate=None
+) -> List[Tuple[datetime, Any]]:
+    """
+    Conta linhas por período em [start, end). Quando start/end não caem em
+    início de período, o primeiro e o último períodos contam só a parte dentro
+    do intervalo (e não entram no cache, que guarda apenas períodos inteiros).
+
+    `metric` identifica a série no cache (ex.: "signups") e deve mudar sempre que
+    `column`, `filters` ou `aggregate` mudarem. `aggregate` substitui o COUNT(*)
+    (ex.: uma soma). Retorna [(início do período, valor), ...] incluindo períodos
+    sem linhas.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularidade inválida: {granularity}. Use: {', '.join(GRANULARITIES)}")
+
+    now = now or datetime.now()
+    periods = period_starts(start, end, granularity)
+    counts: Dict[datetime, Any] = {}
+
+    def whole(period: datetime) -> bool:
+        return period >= start and next_period(period, granularity) <= end
+
+    with _cache_lock:
+        for period in periods:
+            if not whole(period):
+                continue
+            cached = _closed_period_cache.get((metric, granularity, period))
+            if cached is not None:
+                counts[period] = cached
+
+    missing = [period for period in periods if period not in counts]
+    if missing:
+        range_start = max(missing[0], start)
+        range_end = min(next_period(missing[-1], granularity), end)
+        bucket = bucket_expression(column, granularity, db.get_bind().dialect.name).label("bucket")
+
+        rows = (
+            db.query(bucket, (aggregate if aggregate is not None else func.count()).label("total"))
+            .filter(column >= range_start, column < range_end, *filters)
+            .group_by(bucket)
+            .all()
+        )
+        fetched = {as_datetime(row.bucket): row.total or 0 for row in rows}
+
+        with _cache_lock:
+            for period in missing:
+                counts[period] = fetched.get(period, 0)
+                if whole(period) and next_period(period, granularity) <= now:
+                    _closed_period_cache[(metric, granularity, period)] = counts[period]
+
+    return [(period, counts[period]) for period in periods]
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _closed_period_cache.clear()
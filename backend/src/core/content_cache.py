@@ -0,0 +1,88 @@
+"""
+Cache das respostas de leitura de conteúdo (GET /content e GET /content/{id}).
+
+Guarda o JSON já serializado e sua ETag em um LRU com validade curta, por id de
+conteúdo e por consulta de listagem. create/update/delete_content invalidam o
+cache deste processo; a validade (CONTENT_CACHE_SECONDS) limita o tempo que
+outros workers podem servir uma versão antiga.
+"""
+import hashlib
+import os
+import threading
+from typing import Hashable, NamedTuple, Optional
+
+from cachetools import TTLCache
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+
+from src.core.data_version import etag_matches
+
+CACHE_SIZE = int(os.environ.get("CONTENT_CACHE_SIZE", 2048))
+CACHE_SECONDS = int(os.environ.get("CONTENT_CACHE_SECONDS", 60))
+
+# Navegadores e proxies podem reutilizar por pouco tempo e depois revalidar com If-None-Match
+PUBLIC_CACHE_CONTROL = f"public, max-age={CACHE_SECONDS}, must-revalidate"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+_cache: TTLCache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_SECONDS)
+_lock = threading.Lock()
+# Incrementada a cada escrita; leituras iniciadas antes dela não gravam no cache
+_generation = 0
+
+
+def generation() -> int:
+    return _generation
+
+
+def serialize(model: BaseModel) -> CachedResponse:
+    body = model.model_dump_json().encode()
+    return CachedResponse(body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+
+
+def get(key: Hashable) -> Optional[CachedResponse]:
+    with _lock:
+        return _cache.get(key)
+
+
+def put(key: Hashable, model: BaseModel, read_generation: int) -> CachedResponse:
+    """Serializa e guarda, a menos que alguma escrita tenha acontecido desde `read_generation`"""
+    entry = serialize(model)
+    with _lock:
+        if read_generation == _generation:
+            _cache[key] = entry
+    return entry
+
+
+def invalidate(content_id: str) -> None:
+    """Descarta o item e todas as listagens (qualquer página pode conter o conteúdo alterado)"""
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.pop(item_key(content_id), None)
+        for key in [key for key in _cache.keys() if key[0] == "list"]:
+            _cache.pop(key, None)
+
+
+def item_key(content_id: str) -> tuple:
+    return ("item", content_id)
+
+
+def list_key(**params) -> tuple:
+    return ("list",) + tuple(sorted(params.items()))
+
+
+def respond(request: Request, entry: CachedResponse, public: bool = True) -> Response:
+    """200 com o JSON guardado ou 304 se o cliente já tem essa versão"""
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": PUBLIC_CACHE_CONTROL if public else PRIVATE_CACHE_CONTROL,
+    }
+    if etag_matches(request, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
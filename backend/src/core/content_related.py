@@ -0,0 +1,374 @@
+"""
+"Leia também": conteúdos relacionados pré-calculados em memória.
+
+Cada conteúdo publicado vira um vetor esparso com três blocos de atributos:
+termos do texto (TF-IDF sobre título, resumo e corpo), tags e categoria. A
+similaridade é o cosseno entre vetores, calculada com NumPy a partir de listas
+invertidas (atributo -> conteúdos), e os RELATED_TOP_K vizinhos de cada
+conteúdo ficam guardados, então GET /content/{id}/related só lê a memória.
+
+O índice é montado em segundo plano ao iniciar a API. create/update/delete de
+conteúdo atualizam só o conteúdo alterado e as listas de vizinhos afetadas; como
+o IDF dos demais vetores vai ficando defasado, o índice é remontado em segundo
+plano depois de RELATED_REBUILD_CHANGES alterações.
+"""
+import logging
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from src.core.content_search import tokenize
+from src.schemas.models import Content
+
+logger = logging.getLogger(__name__)
+
+TOP_K = int(os.environ.get("RELATED_TOP_K", 10))
+REBUILD_CHANGES = int(os.environ.get("RELATED_REBUILD_CHANGES", 200))
+
+# Peso de cada bloco no vetor final (cada bloco é normalizado antes)
+TEXT_WEIGHT = 1.0
+TAG_WEIGHT = 0.8
+CATEGORY_WEIGHT = 0.4
+
+# O título conta como se aparecesse TITLE_REPEAT vezes
+TITLE_REPEAT = 2
+MIN_TERM_LENGTH = 3
+
+# Termos presentes em mais que MAX_DF dos conteúdos não ajudam a distinguir (a partir de MAX_DF_MIN_DOCS)
+MAX_DF = 0.6
+MAX_DF_MIN_DOCS = 10
+
+MIN_SCORE = 0.01
+
+TAG_PREFIX = "tag:"
+CATEGORY_PREFIX = "cat:"
+TEXT_PREFIX = "t:"
+
+
+class Document(NamedTuple):
+    title: Optional[str]
+    summary: Optional[str]
+    body: Optional[str]
+    category: Optional[str]
+    tags: List[str]
+
+
+def _raw_features(document: Document) -> Counter:
+    features: Counter = Counter()
+    text_tokens = tokenize(document.title) * TITLE_REPEAT + tokenize(document.summary) + tokenize(document.body)
+    for token in text_tokens:
+        if len(token) >= MIN_TERM_LENGTH and not token.isdigit():
+            features[TEXT_PREFIX + token] += 1
+    for tag in document.tags:
+        features[TAG_PREFIX + tag] = 1
+    if document.category:
+        features[CATEGORY_PREFIX + document.category.strip().lower()] = 1
+    return features
+
+
+class _Posting:
+    """Conteúdos (por posição) que têm um atributo, com os pesos; arrays NumPy montados sob demanda"""
+    __slots__ = ("weights", "_arrays")
+
+    def __init__(self):
+        self.weights: Dict[int, float] = {}
+        self._arrays = None
+
+    def set(self, slot: int, weight: float) -> None:
+        self.weights[slot] = weight
+        self._arrays = None
+
+    def discard(self, slot: int) -> None:
+        self.weights.pop(slot, None)
+        self._arrays = None
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._arrays is None:
+            size = len(self.weights)
+            self._arrays = (
+                np.fromiter(self.weights.keys(), dtype=np.int64, count=size),
+                np.fromiter(self.weights.values(), dtype=np.float32, count=size),
+            )
+        return self._arrays
+
+
+class RelatedIndex:
+    """Vetores, listas invertidas e os top-k vizinhos de cada conteúdo"""
+
+    def __init__(self, top_k: int = TOP_K):
+        self.top_k = top_k
+        self._lock = threading.RLock()
+        self._vocabulary: Dict[str, int] = {}
+        self._df: Counter = Counter()
+        self._features: Dict[str, Counter] = {}
+        self._vectors: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._postings: Dict[int, _Posting] = defaultdict(_Posting)
+        self._slots: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._neighbors: Dict[str, List[Tuple[str, float]]] = {}
+        self._referrers: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _feature_id(self, feature: str) -> int:
+        feature_id = self._vocabulary.get(feature)
+        if feature_id is None:
+            feature_id = self._vocabulary[feature] = len(self._vocabulary)
+        return feature_id
+
+    def _add_features(self, content_id: str, features: Counter) -> None:
+        self._features[content_id] = features
+        self._df.update(features.keys())
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = content_id
+        else:
+            slot = len(self._ids)
+            self._ids.append(content_id)
+        self._slots[content_id] = slot
+
+    def _vectorize(self, content_id: str) -> None:
+        """Calcula o vetor TF-IDF normalizado com o DF atual e o publica nas listas invertidas"""
+        total = len(self._features)
+        blocks: Dict[str, Dict[str, float]] = {TEXT_PREFIX: {}, TAG_PREFIX: {}, CATEGORY_PREFIX: {}}
+        for feature, count in self._features[content_id].items():
+            df = self._df[feature]
+            idf = math.log((1 + total) / (1 + df)) + 1
+            if feature.startswith(TEXT_PREFIX):
+                if total >= MAX_DF_MIN_DOCS and df / total > MAX_DF:
+                    continue
+                blocks[TEXT_PREFIX][feature] = (1 + math.log(count)) * idf
+            elif feature.startswith(TAG_PREFIX):
+                blocks[TAG_PREFIX][feature] = idf
+            else:
+                blocks[CATEGORY_PREFIX][feature] = idf
+
+        weights: Dict[str, float] = {}
+        for prefix, block_weight in ((TEXT_PREFIX, TEXT_WEIGHT), (TAG_PREFIX, TAG_WEIGHT), (CATEGORY_PREFIX, CATEGORY_WEIGHT)):
+            norm = math.sqrt(sum(value * value for value in blocks[prefix].values()))
+            for feature, value in blocks[prefix].items():
+                weights[feature] = block_weight * value / norm
+
+        ids = np.fromiter((self._feature_id(feature) for feature in weights), dtype=np.int64, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+        norm = float(np.linalg.norm(values))
+        if norm:
+            values /= norm
+        self._vectors[content_id] = (ids, values)
+        slot = self._slots[content_id]
+        for feature_id, value in zip(ids.tolist(), values.tolist()):
+            self._postings[feature_id].set(slot, value)
+
+    def _scores(self, content_id: str) -> np.ndarray:
+        """Cosseno do conteúdo com todos os outros (indexado por posição)"""
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        ids, values = self._vectors[content_id]
+        for feature_id, value in zip(ids.tolist(), values.tolist()):
+            slots, weights = self._postings[feature_id].arrays()
+            scores[slots] += value * weights
+        scores[self._slots[content_id]] = 0
+        return scores
+
+    def _top(self, scores: np.ndarray) -> List[Tuple[str, float]]:
+        candidates = np.flatnonzero(scores >= MIN_SCORE)
+        if len(candidates) > self.top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], self.top_k - 1)[:self.top_k]]
+        ranked = sorted(candidates.tolist(), key=lambda slot: (-scores[slot], self._ids[slot]))
+        return [(self._ids[slot], round(float(scores[slot]), 4)) for slot in ranked]
+
+    def _set_neighbors(self, content_id: str, neighbors: List[Tuple[str, float]]) -> None:
+        for neighbor_id, _ in self._neighbors.get(content_id, ()):
+            self._referrers[neighbor_id].discard(content_id)
+        self._neighbors[content_id] = neighbors
+        for neighbor_id, _ in neighbors:
+            self._referrers[neighbor_id].add(content_id)
+
+    def _recompute(self, content_id: str) -> None:
+        self._set_neighbors(content_id, self._top(self._scores(content_id)))
+
+    def _offer(self, content_id: str, candidate_id: str, score: float) -> None:
+        """Coloca `candidate_id` entre os vizinhos de `content_id` se ele entrar no top-k"""
+        neighbors = self._neighbors.get(content_id, [])
+        if len(neighbors) >= self.top_k and score <= neighbors[-1][1]:
+            return
+        updated = [item for item in neighbors if item[0] != candidate_id] + [(candidate_id, score)]
+        updated.sort(key=lambda item: (-item[1], item[0]))
+        self._set_neighbors(content_id, updated[:self.top_k])
+
+    def _remove(self, content_id: str) -> Set[str]:
+        """Tira o conteúdo do índice; retorna os conteúdos que o tinham como vizinho"""
+        slot = self._slots.pop(content_id)
+        ids, _ = self._vectors.pop(content_id)
+        for feature_id in ids.tolist():
+            self._postings[feature_id].discard(slot)
+        features = self._features.pop(content_id)
+        self._df.subtract(features.keys())
+        self._df += Counter()  # descarta contagens zeradas
+        self._ids[slot] = None
+        self._free.append(slot)
+        self._set_neighbors(content_id, [])
+        del self._neighbors[content_id]
+        referrers = self._referrers.pop(content_id, set())
+        for referrer in referrers:
+            self._neighbors[referrer] = [item for item in self._neighbors[referrer] if item[0] != content_id]
+        return referrers
+
+    def load(self, documents: Iterable[Tuple[str, Document]]) -> None:
+        """Monta o índice inteiro (DF final antes de calcular os vetores)"""
+        with self._lock:
+            for content_id, document in documents:
+                self._add_features(content_id, _raw_features(document))
+            for content_id in self._slots:
+                self._vectorize(content_id)
+            for content_id in self._slots:
+                self._recompute(content_id)
+
+    def upsert(self, content_id: str, document: Document) -> None:
+        with self._lock:
+            affected = self._remove(content_id) if content_id in self._slots else set()
+            self._add_features(content_id, _raw_features(document))
+            self._vectorize(content_id)
+            scores = self._scores(content_id)
+            self._set_neighbors(content_id, self._top(scores))
+            for slot in np.flatnonzero(scores >= MIN_SCORE).tolist():
+                other_id = self._ids[slot]
+                if other_id not in affected:
+                    self._offer(other_id, content_id, round(float(scores[slot]), 4))
+            # Quem tinha este conteúdo como vizinho e ele perdeu pontos pode ter um substituto melhor
+            for other_id in affected:
+                if other_id in self._slots:
+                    self._recompute(other_id)
+
+    def remove(self, content_id: str) -> None:
+        with self._lock:
+            if content_id not in self._slots:
+                return
+            for other_id in self._remove(content_id):
+                if other_id in self._slots:
+                    self._recompute(other_id)
+
+    def related(self, content_id: str, limit: int) -> List[Tuple[str, float]]:
+        with self._lock:
+            return list(self._neighbors.get(content_id, ())[:limit])
+
+
+_index = RelatedIndex()
+_state_lock = threading.Lock()
+_built = threading.Event()
+_rebuilding = False
+# Alterações feitas durante uma remontagem, reaplicadas no índice novo (None = remover)
+_replay: Dict[str, Optional[Document]] = {}
+_changes_since_build = 0
+
+
+def _documents(db: Session) -> List[Tuple[str, Document]]:
+    from src.core.content_tags import tags_for
+
+    rows = (
+        db.query(Content.id, Content.title, Content.summary, Content.body, Content.category)
+        .filter(Content.published.is_(True))
+        .all()
+    )
+    tags = tags_for(db, [row.id for row in rows])
+    return [
+        (row.id, Document(row.title, row.summary, row.body, row.category, tags[row.id]))
+        for row in rows
+    ]
+
+
+def rebuild(db: Optional[Session] = None) -> None:
+    """Monta um índice novo a partir do banco e troca o atual por ele"""
+    global _index, _rebuilding, _changes_since_build
+    with _state_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+        _replay.clear()
+
+    try:
+        if db is None:
+            from src.core.database import SessionLocal
+
+            with SessionLocal() as session:
+                documents = _documents(session)
+        else:
+            documents = _documents(db)
+        index = RelatedIndex()
+        index.load(documents)
+        with _state_lock:
+            for content_id, document in _replay.items():
+                if document is None:
+                    index.remove(content_id)
+                else:
+                    index.upsert(content_id, document)
+            _index = index
+            _changes_since_build = 0
+        _built.set()
+        logger.info(f"Índice de conteúdos relacionados montado ({len(index)} conteúdos)")
+    finally:
+        with _state_lock:
+            _rebuilding = False
+            _replay.clear()
+
+
+def start_background_rebuild() -> None:
+    def _run():
+        try:
+            rebuild()
+        except Exception as e:
+            logger.error(f"Erro ao montar o índice de conteúdos relacionados: {e}", exc_info=True)
+
+    threading.Thread(target=_run, name="content-related-index", daemon=True).start()
+
+
+def _apply(content_id: str, document: Optional[Document]) -> None:
+    global _changes_since_build
+    with _state_lock:
+        if _rebuilding:
+            _replay[content_id] = document
+        if not _built.is_set():
+            return
+        index = _index
+        _changes_since_build += 1
+        needs_rebuild = _changes_since_build >= REBUILD_CHANGES and not _rebuilding
+    if document is None:
+        index.remove(content_id)
+    else:
+        index.upsert(content_id, document)
+    if needs_rebuild:
+        start_background_rebuild()
+
+
+def update(content: Content, tags: List[str]) -> None:
+    """Reindexa um conteúdo depois do commit (rascunhos saem do índice)"""
+    if not content.published:
+        _apply(content.id, None)
+        return
+    _apply(content.id, Document(content.title, content.summary, content.body, content.category, list(tags)))
+
+
+def remove(content_id: str) -> None:
+    _apply(content_id, None)
+
+
+def related(db: Session, content_id: str, limit: int = TOP_K) -> List[Tuple[str, float]]:
+    """
+    [(content_id, similaridade)] dos conteúdos mais parecidos, do mais para o
+    menos similar. Nunca monta o índice na requisição: enquanto ele não fica
+    pronto retorna [] e garante que há uma montagem em segundo plano (refaz a
+    tentativa se a da inicialização falhou).
+    """
+    if not _built.is_set():
+        with _state_lock:
+            building = _rebuilding
+        if not building:
+            start_background_rebuild()
+        return []
+    return _index.related(content_id, limit)
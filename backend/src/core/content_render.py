@@ -0,0 +1,99 @@
+"""
+Renderização do corpo dos conteúdos (Markdown) no momento da escrita.
+
+create/update_content gravam `body_html` (HTML sanitizado: só tags de texto e
+links/imagens sem JavaScript) e `excerpt` (texto puro para listagens), então as
+leituras não precisam converter nada.
+
+Preencher conteúdos antigos: python -m src.core.content_render
+"""
+import re
+from typing import Optional, Tuple
+
+import markdown
+from lxml import html as lxml_html
+from lxml_html_clean import Cleaner
+
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "nl2br"]
+
+ALLOWED_TAGS = {
+    "p", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6",
+    "strong", "em", "b", "i", "u", "s", "del", "blockquote", "code", "pre",
+    "ul", "ol", "li", "dl", "dt", "dd", "a", "img",
+    "table", "thead", "tbody", "tr", "th", "td", "sup", "sub", "abbr",
+}
+
+ALLOWED_ATTRIBUTES = {"href", "title", "src", "alt", "width", "height", "colspan", "rowspan", "align"}
+
+EXCERPT_CHARS = 280
+
+_cleaner = Cleaner(
+    scripts=True,
+    javascript=True,
+    comments=True,
+    style=True,
+    inline_style=True,
+    links=True,
+    meta=True,
+    page_structure=True,
+    processing_instructions=True,
+    embedded=True,
+    frames=True,
+    forms=True,
+    allow_tags=ALLOWED_TAGS,
+    remove_unknown_tags=False,
+    safe_attrs_only=True,
+    safe_attrs=ALLOWED_ATTRIBUTES,
+    add_nofollow=True,
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def sanitize_html(raw_html: str) -> str:
+    if not raw_html.strip():
+        return ""
+    # O Cleaner devolve o fragmento dentro de um <div> quando há mais de um elemento
+    cleaned = _cleaner.clean_html(f"<div>{raw_html}</div>")
+    if cleaned.startswith("<div>") and cleaned.endswith("</div>"):
+        cleaned = cleaned[len("<div>"):-len("</div>")]
+    return cleaned
+
+
+def excerpt_from_html(body_html: str, max_chars: int = EXCERPT_CHARS) -> str:
+    """Texto puro do HTML, cortado em fim de palavra"""
+    if not body_html:
+        return ""
+    text = _WHITESPACE_RE.sub(" ", lxml_html.fragment_fromstring(body_html, create_parent="div").text_content()).strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return f"{cut.rstrip('.,;:')}…"
+
+
+def render_markdown(body: Optional[str]) -> Tuple[str, str]:
+    """Retorna (HTML sanitizado, resumo em texto puro) do corpo em Markdown"""
+    body_html = sanitize_html(markdown.markdown(body or "", extensions=MARKDOWN_EXTENSIONS, output_format="html"))
+    return body_html, excerpt_from_html(body_html)
+
+
+def backfill(db) -> int:
+    """Renderiza os conteúdos ainda sem body_html; retorna quantos foram atualizados"""
+    from src.schemas.models import Content
+
+    updated = 0
+    for content in db.query(Content).filter(Content.body_html.is_(None)).all():
+        content.body_html, content.excerpt = render_markdown(content.body)
+        updated += 1
+    db.commit()
+    return updated
+
+
+if __name__ == "__main__":
+    from src.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"✅ {backfill(session)} conteúdo(s) renderizado(s)")
+    finally:
+        session.close()
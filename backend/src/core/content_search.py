@@ -0,0 +1,239 @@
+"""
+Busca textual nos conteúdos (título, resumo e corpo).
+
+No PostgreSQL usa a coluna gerada `content.search_vector` (tsvector com a
+configuração portuguese, pesos A/B/C) e o índice GIN criados em
+sql/busca_conteudo.sql; o ranking é ts_rank_cd e os trechos vêm de ts_headline.
+Em outros bancos (SQLite nos testes) usa um índice invertido em memória,
+construído na primeira busca e mantido pelos eventos do ORM.
+"""
+import html
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, literal_column
+from sqlalchemy.orm import Session, object_session
+
+from src.core import after_commit
+from src.schemas.models import Content
+
+TS_CONFIG = "portuguese"
+
+# Pesos por campo, na mesma proporção dos pesos padrão do ts_rank (A=1.0, B=0.4, C=0.2)
+FIELD_WEIGHTS = {"title": 1.0, "summary": 0.4, "body": 0.2}
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_WORDS = 30
+
+# O ts_headline marca os termos com caracteres de uso privado; o trecho é escapado
+# em Python e só então eles viram <mark> (o texto do conteúdo nunca sai como HTML)
+HEADLINE_START = "\ue000"
+HEADLINE_END = "\ue001"
+
+HEADLINE_OPTIONS = (
+    f"StartSel={HEADLINE_START}, StopSel={HEADLINE_END}, "
+    f"MaxWords={SNIPPET_WORDS}, MinWords=10, MaxFragments=2, FragmentDelimiter=\" … \""
+)
+
+# Palavras muito comuns ignoradas pelo fallback (subconjunto do dicionário portuguese)
+STOPWORDS = {
+    "a", "o", "as", "os", "e", "de", "do", "da", "dos", "das", "em", "no", "na", "nos", "nas",
+    "um", "uma", "uns", "umas", "para", "por", "com", "sem", "que", "se", "ao", "aos", "ou",
+    "é", "mais", "como", "mas", "seu", "sua", "seus", "suas", "pelo", "pela", "entre",
+}
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def _fold(word: str) -> str:
+    """Minúsculas e sem acentos, para casar 'força' com 'forca'"""
+    return "".join(
+        char for char in unicodedata.normalize("NFKD", word.lower()) if not unicodedata.combining(char)
+    )
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [
+        token for token in (_fold(word) for word in _WORD_RE.findall(text or ""))
+        if token not in STOPWORDS
+    ]
+
+
+def _escape_headline(snippet: Optional[str]) -> str:
+    """Escapa o trecho gerado pelo ts_headline e troca os marcadores por <mark>"""
+    return (
+        html.escape(snippet or "")
+        .replace(HEADLINE_START, HIGHLIGHT_START)
+        .replace(HEADLINE_END, HIGHLIGHT_END)
+    )
+
+
+def highlight(text: Optional[str], terms: List[str], max_words: int = SNIPPET_WORDS) -> str:
+    """Trecho de `text` em torno da primeira ocorrência dos termos, escapado e com os termos marcados"""
+    words = (text or "").split()
+    if not words:
+        return ""
+    matches = [i for i, word in enumerate(words) if any(token in terms for token in tokenize(word))]
+    start = max(0, matches[0] - max_words // 3) if matches else 0
+    window = words[start:start + max_words]
+    marked = [
+        f"{HIGHLIGHT_START}{html.escape(word)}{HIGHLIGHT_END}" if any(token in terms for token in tokenize(word))
+        else html.escape(word)
+        for word in window
+    ]
+    prefix = "… " if start > 0 else ""
+    suffix = " …" if start + max_words < len(words) else ""
+    return f"{prefix}{' '.join(marked)}{suffix}"
+
+
+class InvertedIndex:
+    """Índice invertido termo -> {content_id: peso}, com o texto para gerar trechos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._documents: Dict[str, Dict[str, float]] = {}
+        self._snippet_source: Dict[str, str] = {}
+        self._published: Dict[str, bool] = {}
+        self.built = False
+
+    def build(self, db: Session) -> None:
+        rows = db.query(Content.id, Content.title, Content.summary, Content.body, Content.published).yield_per(500)
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._snippet_source.clear()
+            self._published.clear()
+            for row in rows:
+                self._add(row.id, row.title, row.summary, row.body, row.published)
+            self.built = True
+
+    def _add(self, content_id, title, summary, body, published) -> None:
+        weights: Counter = Counter()
+        for field, text in (("title", title), ("summary", summary), ("body", body)):
+            for token in tokenize(text):
+                weights[token] += FIELD_WEIGHTS[field]
+        self._documents[content_id] = dict(weights)
+        self._snippet_source[content_id] = " ".join(part for part in (summary, body) if part)
+        self._published[content_id] = bool(published)
+        for token, weight in weights.items():
+            self._postings[token][content_id] = weight
+
+    def _remove(self, content_id: str) -> None:
+        for token in self._documents.pop(content_id, {}):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(content_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._snippet_source.pop(content_id, None)
+        self._published.pop(content_id, None)
+
+    def upsert(self, content_id, title, summary, body, published) -> None:
+        with self._lock:
+            if not self.built:
+                return
+            self._remove(content_id)
+            self._add(content_id, title, summary, body, published)
+
+    def remove(self, content_id: str) -> None:
+        with self._lock:
+            if self.built:
+                self._remove(content_id)
+
+    def search(self, terms: List[str], published_only: bool = True) -> List[Tuple[str, float]]:
+        """[(content_id, rank)] com todos os termos, do mais para o menos relevante"""
+        if not terms:
+            return []
+        with self._lock:
+            total = len(self._documents) or 1
+            candidates = None
+            for term in terms:
+                ids = set(self._postings.get(term, {}))
+                candidates = ids if candidates is None else candidates & ids
+            scored = []
+            for content_id in candidates or ():
+                if published_only and not self._published.get(content_id):
+                    continue
+                # Frequência ponderada pelo campo × raridade do termo (idf)
+                rank = sum(
+                    self._postings[term][content_id] * math.log(1 + total / len(self._postings[term]))
+                    for term in terms
+                )
+                scored.append((content_id, rank))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored
+
+    def snippet(self, content_id: str, terms: List[str]) -> str:
+        with self._lock:
+            source = self._snippet_source.get(content_id, "")
+        return highlight(source, terms)
+
+
+_memory_index = InvertedIndex()
+
+
+def _sync_index(mapper, connection, target) -> None:
+    # Valores lidos agora (no flush); o índice só muda depois do commit
+    values = (str(target.id), target.title, target.summary, target.body, target.published)
+    after_commit.defer(object_session(target), lambda: _memory_index.upsert(*values))
+
+
+def _remove_from_index(mapper, connection, target) -> None:
+    content_id = str(target.id)
+    after_commit.defer(object_session(target), lambda: _memory_index.remove(content_id))
+
+
+def register_search_index_listeners(*models) -> None:
+    """Mantém o índice em memória atualizado a partir das escritas do ORM em `content` (aplicadas no commit)"""
+    for model in models:
+        event.listen(model, "after_insert", _sync_index)
+        event.listen(model, "after_update", _sync_index)
+        event.listen(model, "after_delete", _remove_from_index)
+
+
+def search_contents(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    offset: int = 0,
+    published_only: bool = True
+) -> Tuple[List[Tuple[str, float, str]], bool, str]:
+    """
+    Retorna ([(content_id, rank, trecho destacado), ...], há_mais, backend), com
+    backend "tsvector" ou "memory".
+    """
+    query = query.strip()
+
+    if db.get_bind().dialect.name == "postgresql":
+        tsquery = func.websearch_to_tsquery(TS_CONFIG, query)
+        vector = literal_column("content.search_vector")
+        rank = func.ts_rank_cd(vector, tsquery).label("rank")
+        snippet = func.ts_headline(
+            TS_CONFIG,
+            func.concat_ws(" ", Content.summary, Content.body),
+            tsquery,
+            HEADLINE_OPTIONS
+        ).label("snippet")
+        search = db.query(Content.id, rank, snippet).filter(vector.op("@@")(tsquery))
+        if published_only:
+            search = search.filter(Content.published.is_(True))
+        rows = search.order_by(rank.desc(), Content.id).offset(offset).limit(limit + 1).all()
+        hits = [(row.id, float(row.rank), _escape_headline(row.snippet)) for row in rows]
+        return hits[:limit], len(hits) > limit, "tsvector"
+
+    if not _memory_index.built:
+        _memory_index.build(db)
+
+    terms = list(dict.fromkeys(tokenize(query)))
+    ranked = _memory_index.search(terms, published_only)
+    page = [
+        (content_id, rank, _memory_index.snippet(content_id, terms))
+        for content_id, rank in ranked[offset:offset + limit]
+    ]
+    return page, len(ranked) > offset + limit, "memory"
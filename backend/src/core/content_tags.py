@@ -0,0 +1,77 @@
+"""
+Tags dos conteúdos na tabela content_tags (uma linha por conteúdo e tag).
+
+Os filtros por tag e a contagem de facetas são servidos pelo índice
+(tag, content_id); as tags de uma página inteira de conteúdos são lidas em uma
+única consulta.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import distinct, func, select
+from sqlalchemy.orm import Session
+
+from src.schemas.models import Content, ContentTag
+
+MATCH_ALL = "all"
+MATCH_ANY = "any"
+MATCH_MODES = (MATCH_ALL, MATCH_ANY)
+
+
+def normalize_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    """Minúsculas, sem espaços nas pontas, sem vazias nem repetidas (mantém a ordem)"""
+    result = []
+    for tag in tags or ():
+        tag = tag.strip().lower()
+        if tag and tag not in result:
+            result.append(tag)
+    return result
+
+
+def set_tags(db: Session, content_id: str, tags: Iterable[str]) -> List[str]:
+    """Substitui as tags do conteúdo (sem commit)"""
+    tags = normalize_tags(tags)
+    db.query(ContentTag).filter(ContentTag.content_id == content_id).delete(synchronize_session=False)
+    db.add_all([ContentTag(content_id=content_id, tag=tag) for tag in tags])
+    return tags
+
+
+def delete_tags(db: Session, content_id: str) -> None:
+    db.query(ContentTag).filter(ContentTag.content_id == content_id).delete(synchronize_session=False)
+
+
+def tags_for(db: Session, content_ids: Sequence[str]) -> Dict[str, List[str]]:
+    """{content_id: [tags em ordem alfabética]} para vários conteúdos em uma consulta"""
+    result: Dict[str, List[str]] = {content_id: [] for content_id in content_ids}
+    if not content_ids:
+        return result
+    rows = (
+        db.query(ContentTag.content_id, ContentTag.tag)
+        .filter(ContentTag.content_id.in_(list(content_ids)))
+        .order_by(ContentTag.content_id, ContentTag.tag)
+        .all()
+    )
+    for content_id, tag in rows:
+        result[content_id].append(tag)
+    return result
+
+
+def matching_content_ids(tags: Sequence[str], mode: str = MATCH_ALL):
+    """Subconsulta com os ids dos conteúdos que têm todas (all) ou alguma (any) das tags"""
+    tags = normalize_tags(tags)
+    stmt = select(ContentTag.content_id).where(ContentTag.tag.in_(tags))
+    if mode == MATCH_ALL and len(tags) > 1:
+        stmt = stmt.group_by(ContentTag.content_id).having(func.count(distinct(ContentTag.tag)) == len(tags))
+    return stmt
+
+
+def tag_counts(db: Session, published: Optional[bool] = True, category: Optional[str] = None, limit: int = 50):
+    """[(tag, número de conteúdos), ...] do mais para o menos usado"""
+    total = func.count(ContentTag.content_id).label("count")
+    query = db.query(ContentTag.tag, total)
+    if published is not None or category:
+        query = query.join(Content, Content.id == ContentTag.content_id)
+        if published is not None:
+            query = query.filter(Content.published == published)
+        if category:
+            query = query.filter(Content.category == category)
+    return query.group_by(ContentTag.tag).order_by(total.desc(), ContentTag.tag).limit(limit).all()
@@ -0,0 +1,235 @@
+"""
+Contadores de visualização dos conteúdos e ranking de popularidade.
+
+GET /content/{id} só incrementa um contador em memória; um loop grava o que foi
+acumulado a cada CONTENT_VIEWS_FLUSH_SECONDS, em lote (content.view_count e
+content_views_daily), em vez de um UPDATE por leitura disputando as linhas dos
+conteúdos mais lidos.
+
+A popularidade é o número de visualizações com decaimento exponencial (meia-vida
+CONTENT_POPULARITY_HALF_LIFE_HOURS), calculado por dia a partir de
+content_views_daily. O ranking fica em memória: é montado na primeira consulta,
+recebe as visualizações deste processo na hora e, a cada flush, relê só os dias
+recentes (onde entram as visualizações gravadas pelos outros workers).
+"""
+import asyncio
+import heapq
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from src.core.database import SessionLocal, upsert_insert
+from src.schemas.models import Content, ContentViewDaily
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = float(os.environ.get("CONTENT_VIEWS_FLUSH_SECONDS", 5))
+HALF_LIFE_HOURS = float(os.environ.get("CONTENT_POPULARITY_HALF_LIFE_HOURS", 48))
+
+# Dias lidos ao montar o ranking (com meia-vida de 48h, 30 dias atrás pesam ~2^-15)
+WINDOW_DAYS = int(os.environ.get("CONTENT_POPULARITY_WINDOW_DAYS", 30))
+
+# Dias relidos a cada flush; o dia anterior cobre gravações feitas perto da meia-noite
+REFRESH_DAYS = 2
+
+
+class PopularityRanking:
+    """
+    Pontuação de cada conteúdo relativa a um instante fixo (`anchor`): uma
+    visualização no dia d vale 2^((meio-dia de d - anchor) / meia-vida). Como o
+    decaimento é o mesmo para todos, a ordem só muda quando chegam visualizações;
+    o valor atual (visualizações "decaídas") é pontuação × 2^(-(agora - anchor) / meia-vida).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._anchor = datetime.now()
+        self._views: Dict[str, Dict[date, int]] = defaultdict(dict)
+        self._scores: Dict[str, float] = {}
+        self.built = False
+
+    def _weight(self, day: date) -> float:
+        hours = (datetime.combine(day, time(hour=12)) - self._anchor).total_seconds() / 3600
+        return 2 ** (hours / HALF_LIFE_HOURS)
+
+    def _rescore(self, content_id: str, oldest: date) -> None:
+        days = self._views.get(content_id, {})
+        for day in [day for day in days if day < oldest]:
+            del days[day]
+        if days:
+            self._scores[content_id] = sum(views * self._weight(day) for day, views in days.items())
+        else:
+            self._views.pop(content_id, None)
+            self._scores.pop(content_id, None)
+
+    def _read(self, db: Session, since: date) -> Dict[str, Dict[date, int]]:
+        rows = (
+            db.query(ContentViewDaily.content_id, ContentViewDaily.day, ContentViewDaily.views)
+            .filter(ContentViewDaily.day >= since)
+            .all()
+        )
+        result: Dict[str, Dict[date, int]] = defaultdict(dict)
+        for content_id, day, views in rows:
+            result[content_id][day] = views
+        return result
+
+    def build(self, db: Session, pending: Dict[Tuple[str, date], int]) -> None:
+        oldest = date.today() - timedelta(days=WINDOW_DAYS)
+        stored = self._read(db, oldest)
+        with self._lock:
+            self._views = defaultdict(dict, stored)
+            for (content_id, day), views in pending.items():
+                self._views[content_id][day] = self._views[content_id].get(day, 0) + views
+            self._scores = {}
+            for content_id in list(self._views):
+                self._rescore(content_id, oldest)
+            self.built = True
+
+    def refresh(self, db: Session, pending: Dict[Tuple[str, date], int]) -> None:
+        """Troca os dias recentes pelo que está no banco (+ o que este processo ainda não gravou)"""
+        if not self.built:
+            return
+        today = date.today()
+        since = today - timedelta(days=REFRESH_DAYS - 1)
+        stored = self._read(db, since)
+        with self._lock:
+            touched = set(stored) | {content_id for content_id, _ in pending}
+            for content_id, days in self._views.items():
+                if any(day >= since for day in days):
+                    touched.add(content_id)
+            for content_id in touched:
+                days = self._views[content_id]
+                for day in [day for day in days if day >= since]:
+                    del days[day]
+                days.update(stored.get(content_id, {}))
+            for (content_id, day), views in pending.items():
+                self._views[content_id][day] = self._views[content_id].get(day, 0) + views
+            oldest = today - timedelta(days=WINDOW_DAYS)
+            for content_id in touched:
+                self._rescore(content_id, oldest)
+
+    def add(self, content_id: str, day: date, views: int = 1) -> None:
+        with self._lock:
+            if not self.built:
+                return
+            days = self._views[content_id]
+            days[day] = days.get(day, 0) + views
+            self._scores[content_id] = self._scores.get(content_id, 0.0) + views * self._weight(day)
+
+    def remove(self, content_id: str) -> None:
+        with self._lock:
+            self._views.pop(content_id, None)
+            self._scores.pop(content_id, None)
+
+    def top(self, limit: int) -> List[Tuple[str, float]]:
+        """[(content_id, visualizações decaídas até agora)] do mais para o menos popular"""
+        with self._lock:
+            best = heapq.nlargest(limit, self._scores.items(), key=lambda item: (item[1], item[0]))
+            hours = (datetime.now() - self._anchor).total_seconds() / 3600
+        decay = 2 ** (-hours / HALF_LIFE_HOURS)
+        return [(content_id, score * decay) for content_id, score in best]
+
+
+_ranking = PopularityRanking()
+
+# (content_id, dia) -> visualizações ainda não gravadas no banco
+_pending: Counter = Counter()
+_pending_lock = threading.Lock()
+
+
+def _pending_snapshot() -> Dict[Tuple[str, date], int]:
+    with _pending_lock:
+        return dict(_pending)
+
+
+def record_view(content_id: str) -> None:
+    """Conta uma visualização (só memória; gravada no próximo flush)"""
+    day = date.today()
+    with _pending_lock:
+        _pending[(content_id, day)] += 1
+    _ranking.add(content_id, day)
+
+
+def _write(db: Session, batch: Dict[Tuple[str, date], int]) -> None:
+    totals: Counter = Counter()
+    for (content_id, _), views in batch.items():
+        totals[content_id] += views
+
+    table = Content.__table__
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("b_content_id"))
+        .values(view_count=func.coalesce(table.c.view_count, 0) + bindparam("b_views")),
+        [{"b_content_id": content_id, "b_views": views} for content_id, views in totals.items()],
+    )
+
+    daily = ContentViewDaily.__table__
+    stmt = upsert_insert(db, daily)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[daily.c.content_id, daily.c.day],
+        set_={"views": daily.c.views + stmt.excluded.views},
+    )
+    db.execute(
+        stmt,
+        [{"content_id": content_id, "day": day, "views": views} for (content_id, day), views in batch.items()],
+    )
+
+
+def flush(db: Optional[Session] = None) -> int:
+    """
+    Grava as visualizações acumuladas em uma transação e atualiza o ranking com
+    os dias recentes do banco. Retorna quantas visualizações foram gravadas.
+    """
+    with _pending_lock:
+        batch = dict(_pending)
+        _pending.clear()
+
+    session = db or SessionLocal()
+    try:
+        if batch:
+            try:
+                _write(session, batch)
+                session.commit()
+            except Exception:
+                session.rollback()
+                # Devolve o lote para a próxima tentativa
+                with _pending_lock:
+                    _pending.update(batch)
+                raise
+        _ranking.refresh(session, _pending_snapshot())
+        return sum(batch.values())
+    finally:
+        if db is None:
+            session.close()
+
+
+def delete_views(db: Session, content_id: str) -> None:
+    """Remove o histórico de visualizações do conteúdo (sem commit) e o tira do ranking"""
+    with _pending_lock:
+        for key in [key for key in _pending if key[0] == content_id]:
+            del _pending[key]
+    db.query(ContentViewDaily).filter(ContentViewDaily.content_id == content_id).delete(synchronize_session=False)
+    _ranking.remove(content_id)
+
+
+def popular(db: Session, limit: int) -> List[Tuple[str, float]]:
+    """Os `limit` conteúdos mais populares, montando o ranking na primeira chamada"""
+    if not _ranking.built:
+        _ranking.build(db, _pending_snapshot())
+    return _ranking.top(limit)
+
+
+async def flush_loop() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_SECONDS)
+        try:
+            await run_in_threadpool(flush)
+        except Exception as e:
+            logger.error(f"Erro ao gravar visualizações de conteúdo: {e}", exc_info=True)
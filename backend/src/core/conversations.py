@@ -0,0 +1,247 @@
+"""
+Conversas entre dois usuários (tabela conversas).
+
+Toda mensagem recebe o conversation_id do par remetente/destinatário, derivado
+dos dois ids (não precisa de consulta para descobrir). A linha da conversa guarda
+a última mensagem e quantas não lidas cada participante tem; ela é atualizada na
+mesma transação que grava as mensagens, com incrementos feitos pelo próprio
+banco, então vários workers podem gravar ao mesmo tempo.
+
+Mensagens anteriores às conversas só têm o destinatário (usuario_id). As que dá
+para atribuir ganham conversa com `python -m src.core.conversations` (ver
+backfill_legacy); as demais continuam visíveis no histórico de quem as recebeu.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+
+from src.core import pagination
+from src.core.data_version import bump_data_versions
+from src.core.database import SessionLocal, upsert_insert
+from src.schemas.models import Conversa, Mensagem, Usuario
+
+logger = logging.getLogger(__name__)
+
+# Namespace fixo dos ids de conversa (uuid5 do par de usuários)
+CONVERSATION_NAMESPACE = uuid.UUID("6f4d7c8e-2b1a-4e55-9c1d-3a0b5e7f9d21")
+
+PREVIEW_CHARS = 120
+
+# Mensagens antigas atualizadas por transação em backfill_legacy
+BACKFILL_BATCH = 1000
+
+
+def participants(user_id: str, other_user_id: str) -> Tuple[str, str]:
+    """(usuario_a_id, usuario_b_id): os dois ids em ordem"""
+    return tuple(sorted((str(user_id), str(other_user_id))))
+
+
+def conversation_id(user_id: str, other_user_id: str) -> str:
+    first, second = participants(user_id, other_user_id)
+    return str(uuid.uuid5(CONVERSATION_NAMESPACE, f"{first}|{second}"))
+
+
+def unread_column(conversation: Conversa, user_id: str):
+    return Conversa.unread_a if conversation.usuario_a_id == str(user_id) else Conversa.unread_b
+
+
+def unread_for(conversation: Conversa, user_id: str) -> int:
+    return (conversation.unread_a if conversation.usuario_a_id == str(user_id) else conversation.unread_b) or 0
+
+
+def other_participant(conversation: Conversa, user_id: str) -> str:
+    return conversation.usuario_b_id if conversation.usuario_a_id == str(user_id) else conversation.usuario_a_id
+
+
+def record_messages(db: Session, messages: Iterable[Dict[str, Any]]) -> None:
+    """
+    Atualiza as conversas de mensagens recém-inseridas (sem commit): cria a
+    conversa se preciso, soma as não lidas do destinatário (mensagens sem
+    "lida" contam como não lidas) e troca a última mensagem se a do lote for
+    mais nova que a gravada.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    unread: Dict[str, Dict[str, int]] = defaultdict(lambda: {"unread_a": 0, "unread_b": 0})
+    for message in messages:
+        first, second = participants(message["sender_id"], message["receiver_id"])
+        key = message["conversation_id"]
+        if not message.get("lida"):
+            unread[key]["unread_a" if message["receiver_id"] == first else "unread_b"] += 1
+        latest = rows.get(key)
+        if latest is None or (message["enviado_em"], message["id"]) > (latest["last_message_at"], latest["last_message_id"]):
+            rows[key] = {
+                "id": key,
+                "usuario_a_id": first,
+                "usuario_b_id": second,
+                "last_message_id": message["id"],
+                "last_message_preview": (message.get("conteudo") or "")[:PREVIEW_CHARS],
+                "last_sender_id": message["sender_id"],
+                "last_message_at": message["enviado_em"],
+            }
+    if not rows:
+        return
+
+    table = Conversa.__table__
+    stmt = upsert_insert(db, table)
+    newer = stmt.excluded.last_message_at >= func.coalesce(table.c.last_message_at, stmt.excluded.last_message_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={
+            **{
+                column: case((newer, stmt.excluded[column]), else_=table.c[column])
+                for column in ("last_message_id", "last_message_preview", "last_sender_id", "last_message_at")
+            },
+            "unread_a": table.c.unread_a + stmt.excluded.unread_a,
+            "unread_b": table.c.unread_b + stmt.excluded.unread_b,
+        }
+    )
+    db.execute(stmt, [{**row, **unread[key]} for key, row in rows.items()])
+
+
+def mark_read(db: Session, conversation: Conversa, user_id: str) -> int:
+    """
+    Marca como lidas as mensagens recebidas pelo usuário na conversa e desconta
+    do contador as que foram marcadas (sem commit). Descontar em vez de zerar
+    preserva o incremento de um lote gravado depois deste UPDATE.
+    """
+    table = Mensagem.__table__
+    unread = and_(
+        table.c.conversation_id == conversation.id,
+        table.c.receiver_id == str(user_id),
+        table.c.lida.isnot(True)
+    )
+    updated = 0
+    if db.execute(select(table.c.id).where(unread).limit(1)).first() is not None:
+        # Versão antes do UPDATE: é ela que as mensagens alteradas recebem em sync_version
+        version = bump_data_versions(db, [user_id]).get(str(user_id))
+        updated = db.execute(update(table).where(unread).values(lida=True, sync_version=version)).rowcount
+    if updated:
+        column = unread_column(conversation, user_id)
+        db.execute(
+            update(Conversa.__table__)
+            .where(Conversa.__table__.c.id == conversation.id)
+            .values({column.key: case((column > updated, column - updated), else_=0)})
+        )
+    return updated
+
+
+def message_read(db: Session, message: Mensagem) -> None:
+    """Desconta do contador da conversa uma mensagem que acabou de ser lida (sem commit)"""
+    if not message.conversation_id:
+        return
+    conversation = db.get(Conversa, message.conversation_id)
+    if conversation is None:
+        return
+    column = unread_column(conversation, message.receiver_id)
+    db.execute(
+        update(Conversa.__table__)
+        .where(Conversa.__table__.c.id == conversation.id)
+        .values({column.key: case((column > 0, column - 1), else_=0)})
+    )
+
+
+def for_user(db: Session, user_id: str, cursor: Optional[str], limit: int) -> Tuple[List[Conversa], Optional[str]]:
+    """
+    Conversas do usuário da mais recente para a mais antiga, paginadas por cursor.
+
+    O usuário pode estar em usuario_a_id ou usuario_b_id; em vez de um OR, cada
+    lado é uma leitura de intervalo no seu índice (pagination.merged_page).
+    """
+    queries = [db.query(Conversa).filter(column == str(user_id)) for column in (Conversa.usuario_a_id, Conversa.usuario_b_id)]
+    return pagination.merged_page(queries, Conversa.last_message_at, Conversa.id, cursor, limit)
+
+
+def thread(db: Session, user_id: str, other_user_id: str, cursor: Optional[str], limit: int) -> Tuple[List[Mensagem], Optional[str]]:
+    """
+    Mensagens entre os dois usuários, da mais recente para a mais antiga,
+    paginadas por cursor. Inclui as mensagens antigas sem conversa recebidas
+    por `user_id` (o remetente delas não foi gravado; as de outro destinatário
+    podem ser de terceiros e não entram).
+    """
+    queries = [
+        db.query(Mensagem).filter(Mensagem.conversation_id == conversation_id(user_id, other_user_id)),
+        db.query(Mensagem).filter(Mensagem.conversation_id.is_(None), Mensagem.usuario_id == str(user_id)),
+    ]
+    return pagination.merged_page(queries, Mensagem.enviado_em, Mensagem.id, cursor, limit)
+
+
+def backfill_legacy(db: Session) -> int:
+    """
+    Dá remetente e conversa às mensagens antigas que dá para atribuir e
+    atualiza as conversas (commit a cada BACKFILL_BATCH mensagens).
+
+    Antes das conversas só havia chat entre o administrador e os clientes:
+    com um único admin, o que um cliente recebeu foi enviado por ele. O que o
+    admin recebeu não diz de qual cliente veio e fica como está (ver thread).
+    Retorna o número de mensagens atribuídas.
+    """
+    admins = [row.id for row in db.query(Usuario.id).filter(Usuario.role == "admin").limit(2)]
+    if len(admins) != 1:
+        logger.warning(f"Backfill de conversas ignorado: {len(admins)} administradores (precisa ser exatamente 1)")
+        return 0
+    admin_id = str(admins[0])
+
+    table = Mensagem.__table__
+    legacy = and_(
+        table.c.conversation_id.is_(None),
+        table.c.usuario_id.isnot(None),
+        table.c.usuario_id != admin_id,
+        table.c.enviado_em.isnot(None)
+    )
+    assign = (
+        update(table)
+        .where(table.c.id == bindparam("message_id"))
+        .values(
+            sender_id=bindparam("sender"),
+            receiver_id=bindparam("receiver"),
+            conversation_id=bindparam("conversation"),
+            sync_version=bindparam("version")
+        )
+    )
+    total = 0
+    while True:
+        rows = db.execute(
+            select(table.c.id, table.c.usuario_id, table.c.conteudo, table.c.enviado_em, table.c.lida)
+            .where(legacy)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            return total
+
+        # Os destinatários veem a mudança na próxima sincronização (?since=)
+        versions = bump_data_versions(db, {row.usuario_id for row in rows})
+        messages = [
+            {
+                "id": row.id,
+                "sender_id": admin_id,
+                "receiver_id": str(row.usuario_id),
+                "conversation_id": conversation_id(admin_id, row.usuario_id),
+                "conteudo": row.conteudo,
+                "enviado_em": row.enviado_em,
+                "lida": row.lida
+            }
+            for row in rows
+        ]
+        db.execute(assign, [
+            {
+                "message_id": message["id"],
+                "sender": message["sender_id"],
+                "receiver": message["receiver_id"],
+                "conversation": message["conversation_id"],
+                "version": versions.get(message["receiver_id"])
+            }
+            for message in messages
+        ])
+        record_messages(db, messages)
+        db.commit()
+        total += len(messages)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as session:
+        print(f"✅ {backfill_legacy(session)} mensagem(ns) antiga(s) atribuída(s) a conversas")
@@ -0,0 +1,259 @@
+"""
+Snapshots diários das métricas do painel administrativo (tabela daily_metrics).
+
+Um job agendado grava, para cada dia encerrado, cadastros, assinaturas ativas por
+plano (e o valor pago por elas), receita, mensagens e registros de progresso. As
+análises leem o histórico dessa tabela e só consultam as tabelas vivas para os
+dias fora dela: os ainda sem snapshot (normalmente apenas hoje) e os anteriores
+ao primeiro snapshot. As assinaturas ativas de agora são sempre contadas nas
+tabelas vivas, com a mesma definição usada nos snapshots.
+
+O agendador roda em todos os workers; no PostgreSQL um advisory lock da
+transação garante que só um deles grava os snapshots de cada vez.
+
+Execução manual (cron, backfill): python -m src.core.daily_metrics
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from src.core import analytics
+from src.core.database import SessionLocal
+from src.core.models import Assinatura, DailyMetric, Mensagem, Progresso, Usuario
+
+logger = logging.getLogger(__name__)
+
+# Métricas somáveis entre dias: (coluna de data, agregação; None = COUNT(*))
+ADDITIVE_METRICS = {
+    "signups": (Usuario.created_at, None),
+    "messages": (Mensagem.enviado_em, None),
+    "progress_entries": (Progresso.data_medicao, None),
+    "revenue": (Assinatura.data_inicio, func.coalesce(func.sum(Assinatura.valor_pago), 0)),
+}
+
+# Métricas de estoque (não somáveis), ao fim do dia e por plano: assinaturas
+# ativas e soma do valor pago por elas
+ACTIVE_SUBSCRIPTIONS = "active_subscriptions"
+ACTIVE_REVENUE = "active_revenue"
+
+# Chave do pg_try_advisory_xact_lock que deixa um único worker gravar snapshots
+SNAPSHOT_LOCK_KEY = 7_310_034
+
+# Dias preenchidos retroativamente na primeira execução
+BACKFILL_DAYS = int(os.environ.get("DAILY_METRICS_BACKFILL_DAYS", 400))
+
+# Horário (local) da execução diária
+RUN_AT = time(hour=0, minute=10)
+
+
+def _start_of(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def live_daily_values(db: Session, metric: str, start_day: date, end_day: date) -> Dict[date, float]:
+    """Valores por dia em [start_day, end_day) calculados nas tabelas vivas (dias encerrados ficam em cache)"""
+    if start_day >= end_day:
+        return {}
+    column, aggregate = ADDITIVE_METRICS[metric]
+    series = analytics.count_by_period(
+        db, metric, column, _start_of(start_day), _start_of(end_day), "day", aggregate=aggregate
+    )
+    return {period.date(): float(value) for period, value in series}
+
+
+def _active_subscriptions_at(db: Session, moment: datetime, now: Optional[datetime] = None) -> List[Tuple[str, float, float]]:
+    """
+    [(plano, assinaturas ativas, valor pago por elas)] no instante `moment`.
+
+    Uma assinatura está ativa em `moment` se começou antes dele e termina depois
+    (ou não tem data_fim) e, além disso, está com status "ativa" ou já terminou
+    até `now`. O status só diz algo sobre o presente: uma assinatura cancelada
+    (data_fim = data do cancelamento) ou vencida continua contando nos dias em
+    que esteve ativa. Com `moment` = `now` sobram só as de status "ativa".
+    """
+    now = now or datetime.now()
+    rows = (
+        db.query(Assinatura.plano_id, func.count(Assinatura.id), func.coalesce(func.sum(Assinatura.valor_pago), 0))
+        .filter(
+            Assinatura.data_inicio < moment,
+            or_(Assinatura.data_fim.is_(None), Assinatura.data_fim >= moment),
+            or_(Assinatura.status == "ativa", Assinatura.data_fim < now)
+        )
+        .group_by(Assinatura.plano_id)
+        .all()
+    )
+    return [(plano_id or "", float(total), float(revenue)) for plano_id, total, revenue in rows]
+
+
+def last_snapshot_day(db: Session) -> Optional[date]:
+    return db.query(func.max(DailyMetric.day)).filter(DailyMetric.metric == "signups").scalar()
+
+
+def snapshot_range(db: Session) -> Tuple[Optional[date], Optional[date]]:
+    """(primeiro, último) dia com snapshot; os dias entre eles são contínuos"""
+    first, last = (
+        db.query(func.min(DailyMetric.day), func.max(DailyMetric.day))
+        .filter(DailyMetric.metric == "signups")
+        .one()
+    )
+    return first, last
+
+
+def build_snapshots(db: Session, start_day: date, end_day: date) -> int:
+    """
+    Grava (substituindo) os snapshots dos dias em [start_day, end_day).
+    Retorna o número de dias gravados.
+    """
+    if start_day >= end_day:
+        return 0
+
+    additive = {metric: live_daily_values(db, metric, start_day, end_day) for metric in ADDITIVE_METRICS}
+
+    db.query(DailyMetric).filter(DailyMetric.day >= start_day, DailyMetric.day < end_day).delete(synchronize_session=False)
+
+    day = start_day
+    while day < end_day:
+        for metric, values in additive.items():
+            db.add(DailyMetric(day=day, metric=metric, dimension="", value=values.get(day, 0.0)))
+        for plano_id, total, revenue in _active_subscriptions_at(db, _start_of(day + timedelta(days=1))):
+            db.add(DailyMetric(day=day, metric=ACTIVE_SUBSCRIPTIONS, dimension=plano_id, value=total))
+            db.add(DailyMetric(day=day, metric=ACTIVE_REVENUE, dimension=plano_id, value=revenue))
+        day += timedelta(days=1)
+
+    db.commit()
+    return (end_day - start_day).days
+
+
+def _try_snapshot_lock(db: Session) -> bool:
+    """Lock até o fim da transação (liberado no commit de build_snapshots ou no rollback)"""
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return bool(db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": SNAPSHOT_LOCK_KEY}).scalar())
+
+
+def run_daily_snapshot(today: Optional[date] = None) -> int:
+    """Preenche todos os dias encerrados ainda sem snapshot (até ontem)"""
+    today = today or date.today()
+    db = SessionLocal()
+    try:
+        if not _try_snapshot_lock(db):
+            logger.info("Snapshots diários já estão sendo gravados por outro worker")
+            return 0
+        # Lido depois do lock: inclui o que outro worker acabou de gravar
+        last = last_snapshot_day(db)
+        start_day = last + timedelta(days=1) if last else today - timedelta(days=BACKFILL_DAYS)
+        written = build_snapshots(db, start_day, today)
+        if written:
+            logger.info(f"Snapshots diários gravados: {written} dia(s) a partir de {start_day}")
+        return written
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def daily_series(db: Session, metric: str, start_day: date, end_day: date) -> Dict[date, float]:
+    """
+    Valores diários de uma métrica somável em [start_day, end_day): do snapshot
+    para os dias já gravados e das tabelas vivas para os demais (os anteriores
+    ao primeiro snapshot e os posteriores ao último).
+    """
+    first, last = snapshot_range(db)
+    if not last:
+        return live_daily_values(db, metric, start_day, end_day)
+
+    values: Dict[date, float] = {}
+    snapshot_start = max(start_day, first)
+    snapshot_end = min(end_day, last + timedelta(days=1))
+    if snapshot_start < snapshot_end:
+        rows = (
+            db.query(DailyMetric.day, func.sum(DailyMetric.value))
+            .filter(
+                DailyMetric.metric == metric,
+                DailyMetric.day >= snapshot_start,
+                DailyMetric.day < snapshot_end
+            )
+            .group_by(DailyMetric.day)
+            .all()
+        )
+        values.update({day: float(total or 0) for day, total in rows})
+
+    values.update(live_daily_values(db, metric, start_day, min(end_day, first)))
+    values.update(live_daily_values(db, metric, max(start_day, last + timedelta(days=1)), end_day))
+    return values
+
+
+def current_stock(db: Session) -> Dict[str, Tuple[float, float]]:
+    """
+    {plano: (assinaturas ativas, valor pago por elas)} agora, das tabelas vivas:
+    uma ativação ou cancelamento de hoje aparece na hora, sem esperar o snapshot.
+    É a mesma definição gravada em ACTIVE_SUBSCRIPTIONS/ACTIVE_REVENUE.
+    """
+    now = datetime.now()
+    return {plano_id: (total, revenue) for plano_id, total, revenue in _active_subscriptions_at(db, now, now)}
+
+
+def series_by_period(db: Session, metric: str, start: datetime, end: datetime, granularity: str) -> List[Tuple[datetime, float]]:
+    """
+    Série de uma métrica somável agrupada por dia, semana ou mês em [start, end).
+    Como em analytics.count_by_period, o primeiro e o último períodos contam só
+    a parte dentro do intervalo; pedaços de dia nas pontas (start/end fora da
+    meia-noite, ex.: end = agora) são contados nas tabelas vivas.
+    """
+    periods = analytics.period_starts(start, end, granularity)
+    if not periods:
+        return []
+
+    # Dias inteiros dentro de [start, end)
+    whole_start = analytics.truncate(start, "day")
+    if whole_start < start:
+        whole_start += timedelta(days=1)
+    whole_end = analytics.truncate(end, "day")
+
+    values: Dict[date, float] = {}
+    if whole_start < whole_end:
+        values.update(daily_series(db, metric, whole_start.date(), whole_end.date()))
+        pieces = [(start, whole_start), (whole_end, end)]
+    else:
+        pieces = [(start, end)]
+
+    column, aggregate = ADDITIVE_METRICS[metric]
+    for piece_start, piece_end in pieces:
+        if piece_start >= piece_end:
+            continue
+        for day, value in analytics.count_by_period(db, metric, column, piece_start, piece_end, "day", aggregate=aggregate):
+            values[day.date()] = values.get(day.date(), 0.0) + float(value)
+
+    totals = {period: 0.0 for period in periods}
+    for day, value in values.items():
+        totals[analytics.truncate(_start_of(day), granularity)] += value
+    return [(period, totals[period]) for period in periods]
+
+
+def _seconds_until_next_run(now: datetime) -> float:
+    next_run = datetime.combine(now.date(), RUN_AT)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def daily_snapshot_loop() -> None:
+    """Loop do agendador: preenche o que faltar ao iniciar e depois roda uma vez por dia"""
+    while True:
+        try:
+            await run_in_threadpool(run_daily_snapshot)
+        except Exception as e:
+            logger.error(f"Erro ao gravar snapshots diários: {e}", exc_info=True)
+        await asyncio.sleep(_seconds_until_next_run(datetime.now()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"✅ {run_daily_snapshot()} dia(s) gravado(s) em daily_metrics")
@@ -0,0 +1,182 @@
+"""
+Versão de dados por usuário, usada como ETag nos endpoints do dashboard pessoal.
+
+Toda escrita (insert/update/delete) em treinos, progresso, mensagens, avaliações
+ou assinaturas incrementa `usuarios.data_version` do usuário dono da linha, na
+mesma transação da escrita. Assim os GETs do dashboard conseguem responder 304
+comparando apenas essa versão, sem executar as consultas agregadas.
+
+A mesma versão serve de sequência de alterações: linhas com a coluna
+sync_version (mensagens) recebem a nova versão do dono a cada escrita. Como o
+incremento trava a linha do usuário até o commit, duas transações do mesmo
+usuário nunca gravam a mesma versão nem ficam visíveis fora de ordem, então
+"sync_version > token" devolve tudo o que mudou desde que o token foi lido.
+"""
+import base64
+import hashlib
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Set, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.core.models import Usuario
+
+# Tabelas cujas escritas alteram o dashboard do usuário (coluna usuario_id)
+VERSIONED_TABLES = {"treinos_enviados", "progresso", "mensagens", "avaliacoes", "assinaturas"}
+
+# Colunas de usuarios que mudam sem alterar o conteúdo do dashboard
+_IGNORED_USER_COLUMNS = {"updated_at", "data_version"}
+
+
+def _owners_of(obj) -> Set[str]:
+    """Retorna o dono atual da linha e, se ele mudou nesta flush, o anterior"""
+    owners = set()
+    state = inspect(obj)
+    if "usuario_id" not in state.attrs:
+        return owners
+    history = state.attrs.usuario_id.history
+    for value in list(history.added or ()) + list(history.deleted or ()) + list(history.unchanged or ()):
+        if value:
+            owners.add(str(value))
+    return owners
+
+
+def _profile_changed(obj) -> bool:
+    state = inspect(obj)
+    return any(
+        attr.key not in _IGNORED_USER_COLUMNS and attr.history.has_changes()
+        for attr in state.attrs
+    )
+
+
+def _has_sync_version(obj) -> bool:
+    table = getattr(obj, "__table__", None)
+    return table is not None and "sync_version" in table.c
+
+
+def _bump_data_versions(session: Session, flush_context) -> None:
+    user_ids = set()
+    written = []
+
+    for obj in list(session.new) + list(session.deleted):
+        if getattr(obj, "__tablename__", None) in VERSIONED_TABLES:
+            user_ids |= _owners_of(obj)
+            if obj in session.new and _has_sync_version(obj):
+                written.append(obj)
+
+    for obj in session.dirty:
+        table = getattr(obj, "__tablename__", None)
+        if table in VERSIONED_TABLES and session.is_modified(obj):
+            user_ids |= _owners_of(obj)
+            if _has_sync_version(obj):
+                written.append(obj)
+        elif table == Usuario.__tablename__ and _profile_changed(obj):
+            user_ids.add(str(obj.id))
+
+    versions = bump_data_versions(session, user_ids)
+
+    # Um UPDATE por (tabela, dono) com todas as linhas escritas neste flush
+    stamped: Dict[Tuple[Any, str], List[Any]] = defaultdict(list)
+    for obj in written:
+        owner = str(obj.usuario_id)
+        if owner in versions:
+            stamped[(obj.__table__, owner)].append(obj)
+    for (table, owner), objs in stamped.items():
+        session.connection().execute(
+            update(table).where(table.c.id.in_([obj.id for obj in objs])).values(sync_version=versions[owner])
+        )
+        for obj in objs:
+            set_committed_value(obj, "sync_version", versions[owner])
+
+
+def bump_data_versions(session: Session, user_ids) -> Dict[str, int]:
+    """
+    Incrementa data_version dos usuários na transação da sessão e retorna as
+    novas versões ({user_id: versão}). Escritas feitas pelo ORM já chamam isto
+    no flush; INSERT/UPDATE em lote (Core) chamam direto e gravam a versão
+    retornada em sync_version.
+    """
+    user_ids = {str(user_id) for user_id in user_ids if user_id}
+    if not user_ids:
+        return {}
+    table = Usuario.__table__
+    rows = session.connection().execute(
+        update(table)
+        .where(table.c.id.in_(user_ids))
+        .values(data_version=table.c.data_version + 1)
+        .returning(table.c.id, table.c.data_version)
+    )
+    return {str(row.id): row.data_version for row in rows}
+
+
+def current_data_version(session: Session, user_id: str) -> int:
+    """Versão de dados já gravada do usuário (lida do banco, não do objeto em memória)"""
+    version = session.query(Usuario.data_version).filter(Usuario.id == str(user_id)).scalar()
+    return version or 0
+
+
+def encode_sync_token(version: int) -> str:
+    return base64.urlsafe_b64encode(f"v{version}".encode()).decode()
+
+
+def decode_sync_token(token: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        if not raw.startswith("v"):
+            raise ValueError(raw)
+        return int(raw[1:])
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token de sincronização inválido"
+        )
+
+
+def register_data_version_listener(session_factory) -> None:
+    """Registra o incremento automático de data_version nas sessões da fábrica"""
+    event.listen(session_factory, "after_flush", _bump_data_versions)
+
+
+def dashboard_etag(usuario) -> str:
+    """
+    ETag fraca derivada da versão de dados do usuário.
+
+    Inclui a data de hoje porque alguns campos (dias desde o cadastro,
+    treinos do mês) mudam com o calendário mesmo sem escritas.
+    """
+    raw = f"{usuario.id}:{usuario.data_version or 0}:{date.today().isoformat()}"
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Compara If-None-Match com a ETag atual (comparação fraca, RFC 7232)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def set_etag_headers(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # Resposta pessoal: não deve ser reutilizada por caches compartilhados
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["Vary"] = "Authorization"
+
+
+def not_modified_response(etag: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag_headers(response, etag)
+    return response
@@ -1,7 +1,16 @@
 import os
+import asyncio
+from typing import Any, Callable, Dict
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 from src.core.models import Base  # Certifique-se de que o caminho está correto
+from src.core.models import Content as CoreContent, Usuario as CoreUsuario
+from src.schemas.models import Content as SchemaContent, Usuario as SchemaUsuario
+from src.core.data_version import register_data_version_listener
+from src.core.user_search import register_search_index_listeners
+from src.core import content_search
 
 # 🔐 Obter URL do banco de dados a partir do ambiente
 DATABASE_URL = os.environ.get("DATABASE_URL")
@@ -21,6 +30,20 @@ engine = create_engine(
 # 🛠️ Criar o SessionLocal
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 🏷️ Incrementa usuarios.data_version em escritas que afetam o dashboard (ETags)
+register_data_version_listener(SessionLocal)
+
+# 🔎 Mantém o índice de busca em memória (bancos sem pg_trgm) em dia com a tabela usuarios
+register_search_index_listeners(CoreUsuario, SchemaUsuario)
+content_search.register_search_index_listeners(CoreContent, SchemaContent)
+
+# INSERT com ON CONFLICT (upsert) nos bancos usados: PostgreSQL em produção e SQLite nos testes
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def upsert_insert(db: Session, table):
+    """insert(table) do dialeto da sessão, com on_conflict_do_update/on_conflict_do_nothing"""
+    return _UPSERT_INSERTS[db.get_bind().dialect.name](table)
+
 def get_db():
     """🔄 Dependency Injection para obter uma sessão de banco"""
     db = SessionLocal()
@@ -29,6 +52,37 @@ def get_db():
     finally:
         db.close()
 
+# 🚦 Limite de conexões do pool que uma única requisição pode ocupar em paralelo
+QUERY_CONCURRENCY_LIMIT = int(os.environ.get("DB_QUERY_CONCURRENCY", 4))
+
+async def run_queries_concurrently(
+    queries: Dict[str, Callable[[Session], Any]],
+    max_connections: int = QUERY_CONCURRENCY_LIMIT
+) -> Dict[str, Any]:
+    """
+    ⚡ Executa consultas independentes ao mesmo tempo.
+
+    Cada consulta recebe sua própria sessão (e conexão do pool) e roda em
+    uma thread, de modo que a latência total é a da consulta mais lenta e
+    não a soma de todas. No máximo `max_connections` rodam simultaneamente.
+    Retorna um dicionário com os resultados nas mesmas chaves de `queries`.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_connections))
+
+    def _run(query: Callable[[Session], Any]) -> Any:
+        db = SessionLocal()
+        try:
+            return query(db)
+        finally:
+            db.close()
+
+    async def _run_limited(query: Callable[[Session], Any]) -> Any:
+        async with semaphore:
+            return await run_in_threadpool(_run, query)
+
+    results = await asyncio.gather(*(_run_limited(query) for query in queries.values()))
+    return dict(zip(queries.keys(), results))
+
 def create_tables():
     """📦 Cria todas as tabelas definidas nos modelos"""
     try:
@@ -0,0 +1,141 @@
+"""
+Exportação em streaming de tabelas para o time de BI (CSV ou Parquet).
+
+As linhas são lidas com cursor no servidor (stream_results/yield_per) e
+codificadas em blocos, então o uso de memória não depende do tamanho da tabela.
+CSV pode ser comprimido com zstd; Parquet usa compressão por coluna e usa
+pyarrow (em requirements.txt; sem ele a rota responde 501).
+"""
+import csv
+import io
+from datetime import datetime
+from typing import Iterator, List, Optional, Sequence
+
+import zstandard
+from sqlalchemy import Boolean, DateTime, Float, Integer, select
+
+from src.core.database import SessionLocal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    pa = None
+    pq = None
+    HAS_PYARROW = False
+
+# Linhas por bloco lido do cursor (e por row group no Parquet)
+CHUNK_ROWS = 5000
+
+FORMATS = ("csv", "parquet")
+
+
+def _statement(model, columns: Sequence[str], date_column, start: Optional[datetime], end: Optional[datetime]):
+    stmt = select(*[model.__table__.c[name] for name in columns])
+    if start:
+        stmt = stmt.where(date_column >= start)
+    if end:
+        stmt = stmt.where(date_column < end)
+    return stmt.order_by(date_column, model.__table__.c.id)
+
+
+def _iter_chunks(model, columns, date_column, start, end) -> Iterator[List[tuple]]:
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            _statement(model, columns, date_column, start, end).execution_options(
+                stream_results=True, yield_per=CHUNK_ROWS
+            )
+        )
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(model, columns, date_column, start=None, end=None, compress: bool = False) -> Iterator[bytes]:
+    compressor = zstandard.ZstdCompressor().compressobj() if compress else None
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield emit(buffer.getvalue().encode("utf-8"))
+
+    for rows in _iter_chunks(model, columns, date_column, start, end):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        chunk = emit(buffer.getvalue().encode("utf-8"))
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Arquivo somente-escrita cujo conteúdo é drenado a cada row group"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_type(column):
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    return pa.string()
+
+
+def stream_parquet(model, columns, date_column, start=None, end=None, compress: bool = False) -> Iterator[bytes]:
+    if not HAS_PYARROW:
+        raise RuntimeError("Exportação Parquet requer o pacote pyarrow")
+
+    schema = pa.schema([(name, _arrow_type(model.__table__.c[name])) for name in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd" if compress else "snappy")
+    try:
+        for rows in _iter_chunks(model, columns, date_column, start, end):
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
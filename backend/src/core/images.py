@@ -0,0 +1,210 @@
+"""
+Variantes responsivas das imagens enviadas (capas de conteúdo e avatares).
+
+O upload grava o original com nome derivado do hash do conteúdo e agenda, em um
+pool de processos, a geração de versões WebP e JPEG em larguras fixas. As
+variantes ficam ao lado do original (também com hash no nome, então podem ser
+cacheadas para sempre) e um manifesto `<original>.variants.json` as descreve.
+As respostas da API expõem `srcset` montado a partir desse manifesto.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from PIL import Image, ImageOps
+
+from src.core.storage import get_storage_client
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 640, 1024, 1600)
+
+# formato -> (formato do Pillow, extensão, opções de encode)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+ALLOWED_CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+MAX_UPLOAD_BYTES = int(os.environ.get("IMAGE_MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+
+MANIFEST_SUFFIX = ".variants.json"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Manifestos lidos do disco (inclusive ausentes, enquanto as variantes não ficam prontas)
+_manifest_cache: TTLCache = TTLCache(maxsize=4096, ttl=300)
+_manifest_lock = threading.Lock()
+
+
+def _content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def save_original(bucket: str, prefix: str, data: bytes, content_type: Optional[str]) -> str:
+    """
+    Valida e grava a imagem original em `<prefix>/<hash>.<ext>`; retorna o caminho
+    relativo ao bucket. Levanta ValueError para arquivos inválidos.
+    """
+    extension = ALLOWED_CONTENT_TYPES.get(content_type or "")
+    if not extension:
+        raise ValueError(f"Tipo de imagem não suportado. Use: {', '.join(ALLOWED_CONTENT_TYPES)}")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Imagem maior que o limite de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except Exception:
+        raise ValueError("Arquivo de imagem inválido")
+
+    relative_path = f"{prefix}/{_content_hash(data)}.{extension}"
+    storage = get_storage_client()
+    if not storage.exists(bucket, relative_path):
+        storage.upload(bucket, relative_path, data, content_type)
+    return relative_path
+
+
+def build_variants(bucket_dir: str, relative_path: str) -> dict:
+    """
+    Gera as variantes de uma imagem (executa no pool de processos) e grava o
+    manifesto ao lado do original. Retorna o manifesto.
+    """
+    source = Path(bucket_dir) / relative_path
+    stem = source.name.rsplit(".", 1)[0]
+    relative_dir = Path(relative_path).parent
+
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    original_width, original_height = image.size
+    # Larguras menores que o original, mais o próprio original se ele for menor que a maior largura
+    widths = [width for width in VARIANT_WIDTHS if width < original_width]
+    if original_width <= VARIANT_WIDTHS[-1]:
+        widths.append(original_width)
+
+    manifest = {"width": original_width, "height": original_height, "variants": {}}
+    for name, (pillow_format, extension, options) in VARIANT_FORMATS.items():
+        if pillow_format == "JPEG" and image.mode != "RGB":
+            base = Image.new("RGB", image.size, (255, 255, 255))
+            base.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+        elif pillow_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+            base = image.convert("RGBA")
+        else:
+            base = image
+
+        entries = []
+        for width in widths:
+            height = max(1, round(original_height * width / original_width))
+            resized = base if width == original_width else base.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, pillow_format, **options)
+            data = buffer.getvalue()
+            variant_path = relative_dir / f"{stem}-{width}w.{_content_hash(data)}.{extension}"
+            target = Path(bucket_dir) / variant_path
+            if not target.exists():
+                target.write_bytes(data)
+            entries.append({"width": width, "height": height, "path": variant_path.as_posix()})
+        manifest["variants"][name] = entries
+
+    manifest_path = source.with_name(source.name + MANIFEST_SUFFIX)
+    temporary = manifest_path.with_name(manifest_path.name + ".tmp")
+    temporary.write_text(json.dumps(manifest))
+    os.replace(temporary, manifest_path)
+    return manifest
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: não herda threads/conexões do servidor (fork com threads é inseguro)
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def schedule_variants(bucket: str, relative_path: str, on_done: Optional[Callable[[], None]] = None) -> Future:
+    """Agenda a geração das variantes; `on_done` roda neste processo quando terminar com sucesso"""
+    bucket_dir = str(get_storage_client().buckets[bucket].resolve())
+    future = _get_executor().submit(build_variants, bucket_dir, relative_path)
+
+    def _finished(done: Future) -> None:
+        error = done.exception()
+        if error:
+            logger.error(f"Erro ao gerar variantes de {bucket}/{relative_path}: {error}")
+            return
+        with _manifest_lock:
+            _manifest_cache.pop((bucket, relative_path), None)
+        if on_done:
+            on_done()
+
+    future.add_done_callback(_finished)
+    return future
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _load_manifest(bucket: str, relative_path: str) -> Optional[dict]:
+    key = (bucket, relative_path)
+    with _manifest_lock:
+        if key in _manifest_cache:
+            return _manifest_cache[key]
+    path = get_storage_client().buckets[bucket] / (relative_path + MANIFEST_SUFFIX)
+    try:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        manifest = None
+    with _manifest_lock:
+        _manifest_cache[key] = manifest
+    return manifest
+
+
+def srcset(bucket: str, relative_path: str) -> Optional[Dict[str, object]]:
+    """
+    {"width", "height", "webp": "url 320w, ...", "jpeg": "url 320w, ..."} pronto
+    para <img srcset> / <source srcset>, ou None se as variantes ainda não existem.
+    """
+    manifest = _load_manifest(bucket, relative_path)
+    if not manifest:
+        return None
+    storage = get_storage_client()
+    result: Dict[str, object] = {"width": manifest["width"], "height": manifest["height"]}
+    for name, entries in manifest["variants"].items():
+        result[name] = ", ".join(f"{storage.get_public_url(bucket, entry['path'])} {entry['width']}w" for entry in entries)
+    return result
+
+
+def _split_public_url(url: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(bucket, caminho) de uma URL gerada por get_public_url, ou None para URLs externas"""
+    if not url or "/storage/" not in url:
+        return None
+    bucket, _, relative_path = url.split("/storage/", 1)[1].partition("/")
+    if bucket not in get_storage_client().buckets or not relative_path:
+        return None
+    return bucket, relative_path
+
+
+def srcset_for_url(url: Optional[str]) -> Optional[Dict[str, object]]:
+    location = _split_public_url(url)
+    return srcset(*location) if location else None
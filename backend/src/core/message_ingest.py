@@ -0,0 +1,155 @@
+"""
+Fila de gravação das mensagens enviadas pelo WebSocket.
+
+Os sockets não abrem sessão de banco: entregam a mensagem à fila e aguardam a
+confirmação. Uma tarefa junta o que chegar em até INGEST_BATCH_WAIT_MS (ou
+INGEST_BATCH_SIZE mensagens) e grava o lote com um único INSERT de várias
+linhas com RETURNING, em uma transação (junto com as conversas e o
+data_version dos destinatários); só depois do commit cada remetente recebe o id
+e o horário gravados.
+
+Se o lote falha, as mensagens são regravadas uma a uma, para que uma linha
+inválida não derrube as outras. Quem envia recebe só IngestError, com mensagem
+genérica: o erro do banco traz os parâmetros do lote inteiro (textos e
+destinatários de outros usuários) e fica apenas no log do servidor.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from starlette.concurrency import run_in_threadpool
+
+from src.core import conversations
+from src.core.data_version import bump_data_versions
+from src.core.database import SessionLocal
+from src.schemas.models import Mensagem
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 100))
+BATCH_WAIT_MS = float(os.environ.get("INGEST_BATCH_WAIT_MS", 10))
+# Acima disso quem envia espera (contrapressão) em vez de acumular memória
+QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 10000))
+
+_RETURNING = (Mensagem.id, Mensagem.enviado_em)
+
+
+class IngestError(Exception):
+    """Falha ao gravar uma mensagem (o erro original fica no log, não na mensagem)"""
+
+    def __init__(self):
+        super().__init__("Erro ao gravar mensagem")
+
+
+def write_batch(values: List[Dict[str, Any]]) -> List[Tuple[str, datetime]]:
+    """Grava as mensagens em uma transação; retorna (id, enviado_em) na ordem recebida"""
+    with SessionLocal() as db:
+        # INSERT em lote não passa pelo flush do ORM, que é quem incrementa
+        # data_version; a nova versão de cada destinatário vira o sync_version
+        versions = bump_data_versions(db, [message["receiver_id"] for message in values])
+        rows = db.execute(
+            insert(Mensagem).returning(*_RETURNING, sort_by_parameter_order=True),
+            [{**message, "sync_version": versions.get(message["receiver_id"])} for message in values]
+        ).all()
+        conversations.record_messages(db, values)
+        db.commit()
+    return [(row.id, row.enviado_em) for row in rows]
+
+
+class MessageIngest:
+    def __init__(self, writer=write_batch):
+        self._writer = writer
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+            self._task = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Grava o que ainda está na fila e encerra a tarefa"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, values: Dict[str, Any]) -> Tuple[str, datetime]:
+        """
+        Enfileira uma mensagem (com sender_id e receiver_id) e espera o commit do
+        lote; retorna (id, enviado_em)
+        """
+        self.start()
+        values = {
+            "id": str(uuid.uuid4()),
+            "enviado_em": datetime.now(),
+            "usuario_id": values["receiver_id"],
+            "conversation_id": conversations.conversation_id(values["sender_id"], values["receiver_id"]),
+            **values
+        }
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((values, future))
+        return await future
+
+    async def _next_batch(self) -> List[Tuple[Dict[str, Any], asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + BATCH_WAIT_MS / 1000
+        while len(batch) < BATCH_SIZE:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write_each(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        """Regrava as mensagens de um lote que falhou, uma transação por mensagem"""
+        for values, future in batch:
+            try:
+                result = (await run_in_threadpool(self._writer, [values]))[0]
+            except Exception as e:
+                logger.error(f"Erro ao gravar mensagem {values.get('id')}: {e}", exc_info=True)
+                if not future.done():
+                    future.set_exception(IngestError())
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                results = await run_in_threadpool(self._writer, [values for values, _ in batch])
+            except Exception as e:
+                logger.error(f"Erro ao gravar lote de {len(batch)} mensagem(ns): {e}", exc_info=True)
+                try:
+                    await self._write_each(batch)
+                except Exception:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(IngestError())
+                    raise
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+ingest = MessageIngest()
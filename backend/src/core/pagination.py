@@ -0,0 +1,104 @@
+"""
+Paginação por keyset (cursor) para listas ordenadas da mais recente para a mais antiga.
+
+O cursor é opaco para o cliente: base64 de "<data iso>|<id>" do último item da
+página. A próxima página começa logo depois dele na ordem (data desc, id desc),
+com registros sem data no fim, sem OFFSET.
+
+keyset_page monta a página com leituras de intervalo em um índice
+(filtro, data, id): a condição OR de after_cursor e o NULLS LAST de
+newest_first não batem com a ordem do índice e obrigam o banco a ordenar todas
+as linhas do filtro a cada página.
+"""
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, literal, or_, tuple_
+
+
+def encode_cursor(value: Optional[datetime], row_id: str) -> str:
+    raw = f"{value.isoformat() if value else ''}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        value, row_id = raw.split("|", 1)
+        return (datetime.fromisoformat(value) if value else None), row_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+
+
+def after_cursor(date_column, id_column, cursor: str):
+    """Condição WHERE para os itens depois do cursor na ordem (date desc nulls last, id desc)"""
+    last_date, last_id = decode_cursor(cursor)
+    if last_date is None:
+        return and_(date_column.is_(None), id_column < last_id)
+    return or_(
+        date_column < last_date,
+        and_(date_column == last_date, id_column < last_id),
+        date_column.is_(None)
+    )
+
+
+def newest_first(date_column, id_column):
+    """Ordenação correspondente a after_cursor"""
+    return date_column.desc().nullslast(), id_column.desc()
+
+
+def keyset_page(query, date_column, id_column, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """
+    (linhas, próximo cursor) na ordem de newest_first. Primeiro as linhas com
+    data, por comparação de linha (data, id) < cursor; se a página não encher,
+    completa com as sem data (id < cursor). As duas consultas são intervalos do
+    índice (filtro, data, id) percorrido de trás para frente.
+    """
+    last_date, last_id = decode_cursor(cursor) if cursor else (None, None)
+    rows = []
+    if not cursor or last_date is not None:
+        dated = query.filter(date_column.isnot(None))
+        if cursor:
+            # literal com o tipo da coluna: sem ele o datetime não passa pelo conversor do dialeto
+            bound = tuple_(literal(last_date, date_column.type), literal(last_id, id_column.type))
+            dated = dated.filter(tuple_(date_column, id_column) < bound)
+        rows = dated.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        undated = query.filter(date_column.is_(None))
+        if cursor and last_date is None:
+            undated = undated.filter(id_column < last_id)
+        rows += undated.order_by(id_column.desc()).limit(limit + 1 - len(rows)).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(getattr(rows[-1], date_column.key), getattr(rows[-1], id_column.key)) if has_more else None
+    return rows, next_cursor
+
+
+def merged_page(queries, date_column, id_column, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """
+    keyset_page sobre a união de consultas disjuntas, intercaladas na ordem de
+    newest_first. Substitui um OR entre filtros (que não segue a ordem de nenhum
+    índice): cada consulta continua sendo uma leitura de intervalo no seu índice.
+    """
+    rows = []
+    has_more = False
+    for query in queries:
+        part, part_cursor = keyset_page(query, date_column, id_column, cursor, limit)
+        rows += part
+        has_more = has_more or part_cursor is not None
+
+    date_key, id_key = date_column.key, id_column.key
+    rows.sort(
+        key=lambda row: (getattr(row, date_key) is not None, getattr(row, date_key) or datetime.min, getattr(row, id_key)),
+        reverse=True
+    )
+    has_more = has_more or len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(getattr(rows[-1], date_key), getattr(rows[-1], id_key)) if has_more and rows else None
+    return rows, next_cursor
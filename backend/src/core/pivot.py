@@ -0,0 +1,158 @@
+"""
+Agregações genéricas (pivot) sobre usuários e assinaturas para os gráficos do admin.
+
+O cliente escolhe dimensões e métricas de uma lista fixa; tudo é calculado em um
+único GROUP BY (com ROLLUP opcional para subtotais). Resultados ficam em cache
+por assinatura da consulta durante PIVOT_CACHE_SECONDS.
+"""
+import os
+import threading
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import distinct, func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from src.core import analytics
+from src.core.models import Assinatura, Usuario
+
+# Nome da dimensão -> (expressão SQL dado o dialeto, exige join com assinaturas)
+DIMENSIONS = {
+    "cidade": (lambda dialect: Usuario.cidade, False),
+    "role": (lambda dialect: Usuario.role, False),
+    "signup_month": (lambda dialect: analytics.bucket_expression(Usuario.created_at, "month", dialect), False),
+    "plano_id": (lambda dialect: Assinatura.plano_id, True),
+    "subscription_status": (lambda dialect: Assinatura.status, True),
+}
+
+# Nome da métrica -> (agregação, exige join com assinaturas)
+METRICS = {
+    "users": (lambda: func.count(distinct(Usuario.id)), False),
+    "subscriptions": (lambda: func.count(Assinatura.id), True),
+    "revenue": (lambda: func.coalesce(func.sum(Assinatura.valor_pago), 0), True),
+}
+
+MAX_DIMENSIONS = 3
+
+CACHE_SECONDS = int(os.environ.get("PIVOT_CACHE_SECONDS", 300))
+
+_cache: TTLCache = TTLCache(maxsize=256, ttl=CACHE_SECONDS)
+_cache_lock = threading.Lock()
+
+
+def _validate(dimensions: Sequence[str], metrics: Sequence[str]) -> None:
+    if not dimensions:
+        raise ValueError("Informe ao menos uma dimensão")
+    if len(dimensions) > MAX_DIMENSIONS:
+        raise ValueError(f"No máximo {MAX_DIMENSIONS} dimensões por consulta")
+    if len(set(dimensions)) != len(dimensions):
+        raise ValueError("Dimensões repetidas")
+    invalid = [name for name in dimensions if name not in DIMENSIONS]
+    if invalid:
+        raise ValueError(f"Dimensões inválidas: {', '.join(invalid)}. Use: {', '.join(DIMENSIONS)}")
+    if not metrics:
+        raise ValueError("Informe ao menos uma métrica")
+    invalid = [name for name in metrics if name not in METRICS]
+    if invalid:
+        raise ValueError(f"Métricas inválidas: {', '.join(invalid)}. Use: {', '.join(METRICS)}")
+
+
+def _base_select(columns, needs_subscriptions: bool, start: Optional[datetime], end: Optional[datetime]):
+    stmt = select(*columns).select_from(Usuario)
+    if needs_subscriptions:
+        stmt = stmt.outerjoin(Assinatura, Assinatura.usuario_id == Usuario.id)
+    if start:
+        stmt = stmt.where(Usuario.created_at >= start)
+    if end:
+        stmt = stmt.where(Usuario.created_at < end)
+    return stmt
+
+
+def _statement(dimensions, metrics, rollup: bool, dialect: str, start, end):
+    needs_subscriptions = any(DIMENSIONS[name][1] for name in dimensions) or any(METRICS[name][1] for name in metrics)
+    dims = [DIMENSIONS[name][0](dialect) for name in dimensions]
+    aggregates = [METRICS[name][0]().label(name) for name in metrics]
+    labeled = [expr.label(name) for expr, name in zip(dims, dimensions)]
+
+    if not rollup:
+        return (
+            _base_select(labeled + [literal(0).label("grouping_id")] + aggregates, needs_subscriptions, start, end)
+            .group_by(*dims)
+            .order_by(*dims)
+        )
+
+    if dialect == "postgresql":
+        # GROUPING(a, b, ...) devolve um bitmask: bit 1 = dimensão agregada no subtotal
+        return (
+            _base_select(labeled + [func.grouping(*dims).label("grouping_id")] + aggregates, needs_subscriptions, start, end)
+            .group_by(func.rollup(*dims))
+            .order_by(*[expr.asc().nullsfirst() for expr in dims])
+        )
+
+    # Sem ROLLUP (SQLite): um GROUP BY por nível, unidos em uma única consulta
+    levels = []
+    count = len(dims)
+    for kept in range(count, -1, -1):
+        mask = (1 << (count - kept)) - 1
+        columns = [
+            dims[i].label(dimensions[i]) if i < kept else literal(None).label(dimensions[i])
+            for i in range(count)
+        ]
+        level = _base_select(columns + [literal(mask).label("grouping_id")] + aggregates, needs_subscriptions, start, end)
+        levels.append(level.group_by(*dims[:kept]) if kept else level)
+    combined = union_all(*levels).subquery()
+    return select(combined).order_by(*[combined.c[name] for name in dimensions])
+
+
+def _dimension_value(name: str, value: Any) -> Any:
+    if name == "signup_month" and value is not None:
+        return analytics.period_label(analytics.as_datetime(value), "month")
+    return value
+
+
+def _metric_value(value: Any) -> Any:
+    # SUM no PostgreSQL pode vir como Decimal
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def aggregate(
+    db: Session,
+    dimensions: Sequence[str],
+    metrics: Sequence[str],
+    rollup: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Retorna ([linha, ...], veio_do_cache). Cada linha traz as dimensões, as
+    métricas e `rollup`: dimensões somadas naquele subtotal (vazio = linha de detalhe).
+    """
+    dimensions, metrics = list(dimensions), list(metrics)
+    _validate(dimensions, metrics)
+
+    dialect = db.get_bind().dialect.name
+    signature = (tuple(dimensions), tuple(metrics), rollup, start, end, dialect)
+    with _cache_lock:
+        cached = _cache.get(signature)
+    if cached is not None:
+        return cached, True
+
+    count = len(dimensions)
+    rows = []
+    for row in db.execute(_statement(dimensions, metrics, rollup, dialect, start, end)).mappings():
+        mask = int(row["grouping_id"] or 0)
+        item = {name: _dimension_value(name, row[name]) for name in dimensions}
+        item.update({name: _metric_value(row[name]) for name in metrics})
+        item["rollup"] = [name for i, name in enumerate(dimensions) if mask & (1 << (count - 1 - i))]
+        rows.append(item)
+
+    with _cache_lock:
+        _cache[signature] = rows
+    return rows, False
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
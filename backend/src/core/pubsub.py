@@ -0,0 +1,199 @@
+"""
+Pub/sub entre os workers da API para o WebSocket de mensagens.
+
+Cada worker assina o próprio canal (`<prefixo>:worker:<id>`) e o canal de
+broadcast, e registra em que worker cada usuário está conectado (presença com
+validade, renovada periodicamente; some sozinha se o worker cair). Para entregar
+um evento, o remetente consulta a presença e publica só nos canais dos workers
+que têm o socket do destinatário.
+
+Backends:
+- RedisPubSub: produção (REDIS_URL, o mesmo Redis do docker-compose);
+- InMemoryPubSub: um único processo (testes e desenvolvimento). Várias
+  instâncias com o mesmo InMemoryBroker simulam vários workers.
+
+REALTIME_BACKEND escolhe o backend ("redis" ou "memory"); sem ele, usa Redis
+quando REDIS_URL está definida.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = os.environ.get("REALTIME_CHANNEL_PREFIX", "primefit:ws")
+BROADCAST_CHANNEL = f"{CHANNEL_PREFIX}:broadcast"
+
+# Validade da presença; cada worker renova a dos seus usuários a cada terço desse tempo
+PRESENCE_TTL_SECONDS = int(os.environ.get("REALTIME_PRESENCE_TTL_SECONDS", 60))
+
+# Recebe (canal, evento) publicados para este worker
+Handler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def worker_channel(worker_id: str) -> str:
+    return f"{CHANNEL_PREFIX}:worker:{worker_id}"
+
+
+def presence_key(user_id: str) -> str:
+    return f"{CHANNEL_PREFIX}:presence:{user_id}"
+
+
+class PubSub:
+    """Interface dos backends; um objeto por worker"""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or os.environ.get("WORKER_ID") or uuid.uuid4().hex[:12]
+        self.channel = worker_channel(self.worker_id)
+
+    async def start(self, handler: Handler) -> None:
+        """Assina o canal deste worker e o de broadcast, entregando os eventos a `handler`"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        raise NotImplementedError
+
+    async def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def set_presence(self, user_ids: Set[str]) -> None:
+        """Marca (ou renova) os usuários como conectados a este worker"""
+        raise NotImplementedError
+
+    async def clear_presence(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    async def workers_for(self, user_id: str) -> Set[str]:
+        """Workers com ao menos um socket do usuário (presença ainda válida)"""
+        raise NotImplementedError
+
+
+class InMemoryBroker:
+    """Canais e presença compartilhados pelas InMemoryPubSub de um mesmo processo"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Dict[str, Handler]] = defaultdict(dict)
+        self.presence: Dict[str, Dict[str, float]] = defaultdict(dict)
+
+
+_default_broker = InMemoryBroker()
+
+
+class InMemoryPubSub(PubSub):
+    def __init__(self, worker_id: Optional[str] = None, broker: Optional[InMemoryBroker] = None):
+        super().__init__(worker_id)
+        self.broker = broker or _default_broker
+
+    async def start(self, handler: Handler) -> None:
+        for channel in (self.channel, BROADCAST_CHANNEL):
+            self.broker.subscribers[channel][self.worker_id] = handler
+
+    async def close(self) -> None:
+        for channel in (self.channel, BROADCAST_CHANNEL):
+            self.broker.subscribers[channel].pop(self.worker_id, None)
+        for workers in self.broker.presence.values():
+            workers.pop(self.worker_id, None)
+
+    async def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        # Serializa como o Redis faria: o assinante nunca recebe o mesmo objeto do remetente
+        payload = orjson.dumps(event)
+        for handler in list(self.broker.subscribers.get(channel, {}).values()):
+            try:
+                await handler(channel, orjson.loads(payload))
+            except Exception as e:
+                logger.error(f"Erro ao entregar evento de {channel}: {e}", exc_info=True)
+
+    async def set_presence(self, user_ids: Set[str]) -> None:
+        expires_at = time.time() + PRESENCE_TTL_SECONDS
+        for user_id in user_ids:
+            self.broker.presence[user_id][self.worker_id] = expires_at
+
+    async def clear_presence(self, user_id: str) -> None:
+        self.broker.presence.get(user_id, {}).pop(self.worker_id, None)
+
+    async def workers_for(self, user_id: str) -> Set[str]:
+        now = time.time()
+        return {worker for worker, expires_at in self.broker.presence.get(user_id, {}).items() if expires_at > now}
+
+
+class RedisPubSub(PubSub):
+    """
+    Canais via PUBLISH/SUBSCRIBE; presença em um sorted set por usuário
+    (membro = worker, score = validade), para descartar workers que caíram.
+    """
+
+    def __init__(self, url: str, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        # Importado aqui: só é necessário quando o backend Redis está em uso
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler) -> None:
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel, BROADCAST_CHANNEL)
+        self._reader = asyncio.create_task(self._read(handler))
+
+    async def _read(self, handler: Handler) -> None:
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        await handler(message["channel"], orjson.loads(message["data"]))
+                    except Exception as e:
+                        logger.error(f"Erro ao entregar evento de {message['channel']}: {e}", exc_info=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Conexão caiu: o redis-py reconecta e refaz as assinaturas na próxima leitura
+                logger.error(f"Erro na assinatura do Redis: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.redis.aclose()
+
+    async def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        await self.redis.publish(channel, orjson.dumps(event))
+
+    async def set_presence(self, user_ids: Set[str]) -> None:
+        if not user_ids:
+            return
+        expires_at = time.time() + PRESENCE_TTL_SECONDS
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                key = presence_key(user_id)
+                pipe.zadd(key, {self.worker_id: expires_at})
+                pipe.zremrangebyscore(key, "-inf", time.time())
+                pipe.expire(key, PRESENCE_TTL_SECONDS)
+            await pipe.execute()
+
+    async def clear_presence(self, user_id: str) -> None:
+        await self.redis.zrem(presence_key(user_id), self.worker_id)
+
+    async def workers_for(self, user_id: str) -> Set[str]:
+        return set(await self.redis.zrangebyscore(presence_key(user_id), time.time(), "+inf"))
+
+
+def create_pubsub() -> PubSub:
+    backend = os.environ.get("REALTIME_BACKEND") or ("redis" if os.environ.get("REDIS_URL") else "memory")
+    if backend == "redis":
+        return RedisPubSub(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    if backend == "memory":
+        return InMemoryPubSub()
+    raise ValueError(f"REALTIME_BACKEND inválido: {backend}")
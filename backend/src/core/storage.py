@@ -16,7 +16,8 @@ class LocalStorageClient:
         self.buckets = {
             "arquivos": self.base_path / "arquivos",
             "treinos": self.base_path / "treinos",
-            "avatars": self.base_path / "avatars"
+            "avatars": self.base_path / "avatars",
+            "imagens": self.base_path / "imagens"
         }
         
         for bucket_path in self.buckets.values():
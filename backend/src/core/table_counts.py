@@ -0,0 +1,41 @@
+"""
+Contagem de linhas de tabelas inteiras para os números gerais do painel.
+
+No PostgreSQL um COUNT(*) exato varre a tabela toda; para tabelas grandes usamos
+a estimativa mantida pelo autovacuum/ANALYZE em pg_class.reltuples. Tabelas
+pequenas, bancos sem estatísticas (SQLite) ou pedidos explícitos continuam com
+a contagem exata.
+"""
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+# Abaixo disso a contagem exata é barata e preferível à estimativa
+APPROXIMATE_MIN_ROWS = int(os.environ.get("APPROXIMATE_COUNT_MIN_ROWS", 10000))
+
+EXACT = "exact"
+APPROXIMATE = "approximate"
+
+
+def estimated_count(db: Session, table_name: str) -> Optional[int]:
+    """Estimativa do planner para a tabela, ou None se indisponível (nunca analisada ou outro banco)"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"),
+        {"table_name": table_name}
+    ).scalar()
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
+def count_rows(db: Session, model, exact: bool = False) -> Tuple[int, str]:
+    """Retorna (total de linhas de `model`, "approximate" ou "exact")"""
+    if not exact:
+        estimate = estimated_count(db, model.__tablename__)
+        if estimate is not None and estimate >= APPROXIMATE_MIN_ROWS:
+            return estimate, APPROXIMATE
+    return db.query(func.count()).select_from(model).scalar(), EXACT
@@ -0,0 +1,179 @@
+"""
+Busca aproximada de usuários por nome, email e cidade (tolerante a erros de digitação).
+
+No PostgreSQL usa a extensão pg_trgm: o operador `%` e o ILIKE são servidos
+pelos índices GIN criados em sql/busca_trigram_usuarios.sql e o ranking usa
+`similarity()`. Em outros bancos (SQLite nos testes) usa um índice de trigramas
+em memória, construído na primeira busca e mantido pelos eventos do ORM (as
+alterações entram no índice só depois do commit; rollback as descarta).
+"""
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session, object_session
+
+from src.core import after_commit
+from src.core.models import Usuario
+
+SEARCH_FIELDS = ("nome", "email", "cidade")
+
+# Similaridade mínima do fallback em memória (mesmo padrão do pg_trgm.similarity_threshold)
+SIMILARITY_THRESHOLD = 0.3
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def trigrams(text: Optional[str]) -> Set[str]:
+    """Trigramas no mesmo formato do pg_trgm: palavras em minúsculas com '  ' antes e ' ' depois"""
+    result = set()
+    for word in _WORD_RE.findall((text or "").lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class TrigramIndex:
+    """Índice invertido trigrama -> ids de usuários, com os trigramas de cada campo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._documents: Dict[str, Dict[str, Set[str]]] = {}
+        self._texts: Dict[str, str] = {}
+        self.built = False
+
+    def build(self, db: Session) -> None:
+        rows = db.query(Usuario.id, Usuario.nome, Usuario.email, Usuario.cidade).yield_per(1000)
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._texts.clear()
+            for row in rows:
+                self._add(row.id, {field: getattr(row, field) for field in SEARCH_FIELDS})
+            self.built = True
+
+    def _add(self, user_id: str, values: Dict[str, Optional[str]]) -> None:
+        fields = {field: trigrams(values.get(field)) for field in SEARCH_FIELDS}
+        self._documents[user_id] = fields
+        self._texts[user_id] = " ".join((values.get(field) or "").lower() for field in SEARCH_FIELDS)
+        for grams in fields.values():
+            for gram in grams:
+                self._postings[gram].add(user_id)
+
+    def _remove(self, user_id: str) -> None:
+        fields = self._documents.pop(user_id, None)
+        self._texts.pop(user_id, None)
+        if not fields:
+            return
+        for grams in fields.values():
+            for gram in grams:
+                ids = self._postings.get(gram)
+                if ids:
+                    ids.discard(user_id)
+                    if not ids:
+                        del self._postings[gram]
+
+    def upsert(self, user_id: str, values: Dict[str, Optional[str]]) -> None:
+        with self._lock:
+            if not self.built:
+                return
+            self._remove(user_id)
+            self._add(user_id, values)
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            if self.built:
+                self._remove(user_id)
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        query_grams = trigrams(query)
+        needle = query.lower()
+        with self._lock:
+            candidates: Set[str] = set()
+            for gram in query_grams:
+                candidates |= self._postings.get(gram, set())
+
+            scored = []
+            for user_id in candidates:
+                fields = self._documents[user_id]
+                score = max(similarity(query_grams, grams) for grams in fields.values())
+                # Como no PostgreSQL: parecido o bastante (%) ou contém o termo (ILIKE)
+                if score >= SIMILARITY_THRESHOLD or needle in self._texts[user_id]:
+                    scored.append((user_id, score))
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+
+_memory_index = TrigramIndex()
+
+
+def _sync_index(mapper, connection, target) -> None:
+    # Valores lidos agora (no flush); o índice só muda depois do commit
+    user_id = str(target.id)
+    values = {field: getattr(target, field, None) for field in SEARCH_FIELDS}
+    after_commit.defer(object_session(target), lambda: _memory_index.upsert(user_id, values))
+
+
+def _remove_from_index(mapper, connection, target) -> None:
+    user_id = str(target.id)
+    after_commit.defer(object_session(target), lambda: _memory_index.remove(user_id))
+
+
+def register_search_index_listeners(*models) -> None:
+    """Mantém o índice em memória atualizado a partir das escritas do ORM em `usuarios` (aplicadas no commit)"""
+    for model in models:
+        event.listen(model, "after_insert", _sync_index)
+        event.listen(model, "after_update", _sync_index)
+        event.listen(model, "after_delete", _remove_from_index)
+
+
+def search_users(db: Session, query: str, limit: int = 20) -> Tuple[List[Tuple[Usuario, float]], str]:
+    """
+    Retorna [(usuário, similaridade), ...] do mais para o menos parecido e o
+    backend usado ("pg_trgm" ou "memory").
+    """
+    query = query.strip()
+
+    if db.get_bind().dialect.name == "postgresql":
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped}%"
+        score = func.greatest(
+            func.similarity(func.coalesce(Usuario.nome, ""), query),
+            func.similarity(func.coalesce(Usuario.email, ""), query),
+            func.similarity(func.coalesce(Usuario.cidade, ""), query)
+        ).label("score")
+        rows = (
+            db.query(Usuario, score)
+            .filter(or_(
+                Usuario.nome.op("%")(query),
+                Usuario.email.op("%")(query),
+                Usuario.cidade.op("%")(query),
+                Usuario.nome.ilike(pattern, escape="\\"),
+                Usuario.email.ilike(pattern, escape="\\"),
+                Usuario.cidade.ilike(pattern, escape="\\")
+            ))
+            .order_by(score.desc(), Usuario.nome)
+            .limit(limit)
+            .all()
+        )
+        return [(user, float(rank)) for user, rank in rows], "pg_trgm"
+
+    if not _memory_index.built:
+        _memory_index.build(db)
+
+    ranked = _memory_index.search(query, limit)
+    if not ranked:
+        return [], "memory"
+    users = {user.id: user for user in db.query(Usuario).filter(Usuario.id.in_([user_id for user_id, _ in ranked]))}
+    return [(users[user_id], score) for user_id, score in ranked if user_id in users], "memory"
@@ -0,0 +1,113 @@
+"""
+Codificação dos eventos do WebSocket de mensagens.
+
+Um evento vira um Frame, codificado uma única vez por formato (orjson para
+JSON, msgpack) e reutilizado para todos os destinatários, então o custo
+de um broadcast não cresce com o número de sockets.
+
+O formato é negociado na conexão pelo subprotocolo do WebSocket
+(`new WebSocket(url, ["msgpack"])`); sem subprotocolo a conexão usa JSON em
+frames de texto. Com msgpack (em requirements.txt) os frames são binários nos
+dois sentidos; se o pacote não estiver instalado, o subprotocolo é recusado e
+a conexão fica em JSON.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+# Em ordem de preferência quando o cliente oferece mais de um
+SUPPORTED_ENCODINGS = (MSGPACK, JSON) if msgpack is not None else (JSON,)
+
+
+class Frame:
+    """Um evento e suas codificações, calculadas na primeira vez que cada formato é pedido"""
+    __slots__ = ("_message", "_text", "_binary")
+
+    def __init__(self, message: Optional[Dict[str, Any]] = None, text: Optional[str] = None):
+        self._message = message
+        self._text = text
+        self._binary: Optional[bytes] = None
+
+    @classmethod
+    def from_json(cls, text: str) -> "Frame":
+        """Frame a partir de um JSON já codificado (ex.: recebido de outro worker pelo pub/sub)"""
+        return cls(text=text)
+
+    @property
+    def message(self) -> Dict[str, Any]:
+        if self._message is None:
+            self._message = orjson.loads(self._text)
+        return self._message
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = orjson.dumps(self._message).decode()
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = msgpack.packb(self.message, use_bin_type=True)
+        return self._binary
+
+
+def _offered(websocket: WebSocket) -> List[str]:
+    return [
+        protocol.strip().lower()
+        for protocol in websocket.headers.get("sec-websocket-protocol", "").split(",")
+        if protocol.strip()
+    ]
+
+
+def negotiate(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """
+    (formato, subprotocolo a confirmar no handshake): o primeiro formato suportado
+    entre os oferecidos pelo cliente, ou JSON sem subprotocolo.
+    """
+    offered = _offered(websocket)
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in offered:
+            return encoding, encoding
+    return JSON, None
+
+
+async def send(websocket: WebSocket, frame: Frame, encoding: str) -> None:
+    if encoding == MSGPACK:
+        await websocket.send_bytes(frame.binary)
+    else:
+        await websocket.send_text(frame.text)
+
+
+async def receive(websocket: WebSocket, encoding: str) -> Dict[str, Any]:
+    """
+    Próxima mensagem do cliente já decodificada. Levanta WebSocketDisconnect
+    quando o cliente fecha e ValueError para conteúdo inválido.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+
+    if message.get("bytes") is not None:
+        if encoding == MSGPACK:
+            try:
+                data = msgpack.unpackb(message["bytes"], raw=False)
+            except Exception as e:
+                raise ValueError(f"msgpack inválido: {e}")
+        else:
+            data = orjson.loads(message["bytes"])
+    else:
+        data = orjson.loads(message.get("text") or "")
+
+    if not isinstance(data, dict):
+        raise ValueError("Formato de mensagem inválido")
+    return data
@@ -1,18 +1,45 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import AliasChoices, BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 
 class MessageCreate(BaseModel):
-    sender: str
-    receiver: str
-    content: str
+    # Aceita também "usuario_id", o nome usado antes de existir sender/receiver
+    receiver_id: str = Field(validation_alias=AliasChoices("receiver_id", "usuario_id"))
+    assunto: Optional[str] = None
+    conteudo: str
 
 class MessageResponse(BaseModel):
     id: Optional[str] = None
-    sender: str
-    receiver: str
-    timestamp: datetime
-    content: str
+    sender_id: Optional[str] = None  # vazio nas mensagens anteriores às conversas
+    receiver_id: Optional[str] = None
+    conversation_id: Optional[str] = None
+    usuario_id: Optional[str] = None
+    assunto: Optional[str] = None
+    conteudo: Optional[str] = None
+    enviado_em: Optional[datetime] = None
+    lida: Optional[bool] = False
+    respondida: Optional[bool] = False
 
     class Config:
         from_attributes = True
+
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None
+
+class MessageSyncPage(BaseModel):
+    items: List[MessageResponse]
+    sync_token: str  # enviar como `since` na próxima sincronização
+
+class ConversationResponse(BaseModel):
+    id: str
+    other_user_id: str
+    last_message_id: Optional[str] = None
+    last_message_preview: Optional[str] = None
+    last_sender_id: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+    unread_count: int = 0
+
+class ConversationPage(BaseModel):
+    items: List[ConversationResponse]
+    next_cursor: Optional[str] = None
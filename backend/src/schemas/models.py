@@ -1,8 +1,8 @@
-from sqlalchemy import Column, String, DateTime, Integer, Float, Boolean
+from sqlalchemy import Column, String, Date, DateTime, Integer, Float, Boolean, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 Base = declarative_base()
@@ -26,12 +26,18 @@ class Usuario(Base):
     telefone = Column(String, nullable=True)
     whatsapp = Column(String, nullable=True)
     treino_pdf = Column(String, nullable=True)
+    avatar_url = Column(String, nullable=True)  # original; variantes em src/core/images.py
+    # Incrementada a cada escrita nos dados do usuário (ver src/core/data_version.py)
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
 
 # Alias para compatibilidade com código existente
 Profile = Usuario
 
 class TreinoEnviado(Base):
     __tablename__ = "treinos_enviados"
+    __table_args__ = (
+        Index("ix_treinos_enviados_usuario_data", "usuario_id", "enviado_em", "id"),
+    )
 
     id = Column(String, primary_key=True)
     usuario_id = Column(String)
@@ -41,6 +47,10 @@ class TreinoEnviado(Base):
 
 class Progresso(Base):
     __tablename__ = "progresso"
+    __table_args__ = (
+        # Primeira/última medição e contagem por usuário sem varrer o histórico
+        Index("ix_progresso_usuario_data", "usuario_id", "data_medicao", "id"),
+    )
 
     id = Column(String, primary_key=True)
     usuario_id = Column(String)
@@ -52,6 +62,9 @@ class Progresso(Base):
 
 class Avaliacao(Base):
     __tablename__ = "avaliacoes"
+    __table_args__ = (
+        Index("ix_avaliacoes_usuario_data", "usuario_id", "data", "id"),
+    )
 
     id = Column(String, primary_key=True)
     usuario_id = Column(String)
@@ -65,16 +78,57 @@ class Avaliacao(Base):
 
 class Mensagem(Base):
     __tablename__ = "mensagens"
+    __table_args__ = (
+        Index("ix_mensagens_usuario_data", "usuario_id", "enviado_em", "id"),
+        # Histórico paginado de uma conversa (keyset enviado_em desc, id desc)
+        Index("ix_mensagens_conversa_data", "conversation_id", "enviado_em", "id"),
+        # Mensagens antigas sem conversa no histórico de quem as recebeu
+        Index(
+            "ix_mensagens_legado_usuario_data", "usuario_id", "enviado_em", "id",
+            postgresql_where=text("conversation_id IS NULL")
+        ),
+        # Sincronização incremental da caixa de entrada (?since=)
+        Index("ix_mensagens_usuario_sync", "usuario_id", "sync_version"),
+    )
 
     id = Column(String, primary_key=True)
-    usuario_id = Column(String)
+    usuario_id = Column(String)  # destinatário (mesmo valor de receiver_id; mantido para consultas antigas)
+    sender_id = Column(String)
+    receiver_id = Column(String)
+    conversation_id = Column(String)  # src/core/conversations.py
     assunto = Column(String)
     conteudo = Column(String)
     enviado_em = Column(DateTime, default=func.now())
-    respondi = Column(Boolean, default=False)
+    lida = Column(Boolean, default=False)
+    respondida = Column(Boolean, default=False)
+    # data_version do destinatário na última escrita (ver src/core/data_version.py)
+    sync_version = Column(Integer)
+
+class Conversa(Base):
+    """Uma conversa entre dois usuários, com a última mensagem e as não lidas de cada lado"""
+    __tablename__ = "conversas"
+    __table_args__ = (
+        # Lista de conversas de um usuário, da mais recente para a mais antiga
+        Index("ix_conversas_usuario_a_ultima", "usuario_a_id", "last_message_at", "id"),
+        Index("ix_conversas_usuario_b_ultima", "usuario_b_id", "last_message_at", "id"),
+    )
+
+    id = Column(String, primary_key=True)
+    usuario_a_id = Column(String, nullable=False)  # menor id dos dois participantes
+    usuario_b_id = Column(String, nullable=False)
+    last_message_id = Column(String)
+    last_message_preview = Column(String)
+    last_sender_id = Column(String)
+    last_message_at = Column(DateTime)
+    unread_a = Column(Integer, nullable=False, default=0)  # não lidas por usuario_a
+    unread_b = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=func.now())
 
 class Assinatura(Base):
     __tablename__ = "assinaturas"
+    __table_args__ = (
+        Index("ix_assinaturas_usuario_inicio", "usuario_id", "data_inicio", "id"),
+    )
 
     id = Column(String, primary_key=True)
     usuario_id = Column(String)
@@ -254,21 +308,54 @@ class ProgressoResponse(BaseModel):
 
 class Content(Base):
     __tablename__ = "content"
+    __table_args__ = (
+        # Listagem paginada por keyset (published, created_at desc, id desc)
+        Index("ix_content_published_created", "published", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True)
     title = Column(String)
     summary = Column(String)
-    body = Column(String)
+    body = Column(String)  # Markdown
+    body_html = Column(String)  # HTML sanitizado gerado na escrita (src/core/content_render.py)
+    excerpt = Column(String)  # texto puro para listagens
     author_id = Column(String)
     category = Column(String)
-    tags = Column(String)  # Assuming tags are stored as a comma-separated string for simplicity
     image_url = Column(String)
+    view_count = Column(Integer, default=0)  # acumulado pelo flush de src/core/content_views.py
     published = Column(Boolean, default=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+class ContentTag(Base):
+    """Tags dos conteúdos, uma linha por (conteúdo, tag)"""
+    __tablename__ = "content_tags"
+    __table_args__ = (
+        # Filtro por tag e contagem de facetas; (content_id, tag) já é a chave primária
+        Index("ix_content_tags_tag_content", "tag", "content_id"),
+    )
+
+    content_id = Column(String, primary_key=True)
+    tag = Column(String, primary_key=True)
+
+class ContentViewDaily(Base):
+    """Visualizações de cada conteúdo por dia (base do ranking de popularidade)"""
+    __tablename__ = "content_views_daily"
+    __table_args__ = (
+        # Recarga do ranking: dias recentes de todos os conteúdos
+        Index("ix_content_views_daily_day", "day"),
+    )
+
+    content_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    views = Column(Integer, nullable=False, default=0)
+
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        # Página de comentários por cursor e contagem por conteúdo
+        Index("ix_comments_content_created", "content_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True)
     content_id = Column(String)
@@ -292,16 +379,65 @@ class ContentResponse(BaseModel):
     title: str
     summary: str
     body: str
+    body_html: str = ""
+    excerpt: str = ""
     author_id: str
     category: str
     tags: List[str]
     image_url: Optional[str] = None
+    image_srcset: Optional[Dict[str, Any]] = None  # variantes WebP/JPEG (src/core/images.py)
     published: bool = True
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     model_config = {"from_attributes": True}
 
+class ContentListItem(BaseModel):
+    """Item da listagem de conteúdos: sem o corpo, que só vem em GET /content/{id}"""
+    id: str
+    title: str
+    summary: str
+    excerpt: Optional[str] = None
+    category: str
+    tags: List[str]
+    image_url: Optional[str] = None
+    image_srcset: Optional[Dict[str, Any]] = None  # variantes WebP/JPEG (src/core/images.py)
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    comment_count: int = 0
+
+    model_config = {"from_attributes": True}
+
+class ContentPage(BaseModel):
+    items: List[ContentListItem]
+    next_cursor: Optional[str] = None
+
+class ContentSearchHit(ContentListItem):
+    rank: float
+    snippet: str
+
+class ContentSearchPage(BaseModel):
+    items: List[ContentSearchHit]
+    next_offset: Optional[int] = None
+    backend: str
+
+class ContentPopularItem(ContentListItem):
+    view_count: int = 0
+    popularity: float  # visualizações com decaimento exponencial (src/core/content_views.py)
+
+class ContentPopularPage(BaseModel):
+    items: List[ContentPopularItem]
+
+class ContentRelatedItem(ContentListItem):
+    score: float  # similaridade (cosseno) com o conteúdo de origem
+
+class ContentRelatedPage(BaseModel):
+    items: List[ContentRelatedItem]
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
+
 class CommentCreate(BaseModel):
     text: str
 
@@ -314,6 +450,10 @@ class CommentResponse(BaseModel):
 
     model_config = {"from_attributes": True}
 
+class CommentPage(BaseModel):
+    items: List[CommentResponse]
+    next_cursor: Optional[str] = None
+
 class PlanCreate(BaseModel):
     name: str
     description: str